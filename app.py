@@ -8,33 +8,39 @@ routes for intake, kiosk, vitals, queue, staff, display, camera stream.
 Run: pip install -r requirements.txt && uvicorn app:app --host 0.0.0.0 --port 8000
 """
 
+import base64
+import copy
+import functools
 import io
 import json
 import hashlib
+import heapq
 import hmac
 import os
 import random
 import re
+import secrets
 import sys
 import asyncio
 import threading
 import time
-import uuid
 import sqlite3
 import urllib.error
 import urllib.request
-from collections import deque
+from collections import Counter, deque
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Optional
 
-import qrcode
+import numpy as np
+import orjson
+import segno
 from fastapi import FastAPI, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from dotenv import load_dotenv
@@ -84,6 +90,33 @@ class VitalsSubmitRequest(BaseModel):
     ts: str = ""
 
 
+class VitalsSample(BaseModel):
+    """One reading inside a batched vitals submission."""
+    spo2: Optional[float] = None
+    hr: Optional[float] = None
+    temp_c: Optional[float] = None
+    bp_sys: Optional[float] = None
+    bp_dia: Optional[float] = None
+    confidence: float = 0.9
+    simulated: int = 0
+    ts: str = ""
+
+
+# Upper bound on readings accepted per batch request
+VITALS_BATCH_MAX = 500
+
+
+class VitalsBatchRequest(BaseModel):
+    """JSON body for sensor bridge batches: several readings for one patient in one request."""
+    token: str = ""
+    pid: str = ""
+    device_id: str = "sensors"
+    # Client-chosen id, the same on every resend of a batch; a repeat is acknowledged but not stored
+    batch_id: str = Field(default="", max_length=64)
+    # Enforced during validation, so an oversized list is rejected before every sample is parsed
+    samples: list[VitalsSample] = Field(default_factory=list, max_length=VITALS_BATCH_MAX)
+
+
 class InsuranceEligibilityRequest(BaseModel):
     """Request body for insurance eligibility checks (integration-ready, non-diagnostic)."""
     encounter_id: str = ""
@@ -135,16 +168,42 @@ OPENAI_TTS_VOICE = os.getenv("OPENAI_TTS_VOICE", "nova").strip().lower() or "nov
 SENSOR_BRIDGE_URL = (os.getenv("SENSOR_BRIDGE_URL", "").strip() or "").rstrip("/")
 INSURANCE_ADAPTER_NAME = os.getenv("INSURANCE_ADAPTER", "mock").strip().lower()
 patients: dict[str, dict[str, Any]] = {}
+# Active queue, maintained incrementally: pids are appended at check-in (or seeding) and
+# removed when staff mark them done, so it never holds pending or completed patients.
 queue_order: list[str] = []
 provider_count = 1
 demo_mode = False
 issued_tokens: set[str] = set()
+# Reverse index: uppercase token -> pid (kept in sync at patient creation and reset).
+_token_to_pid: dict[str, str] = {}
 arrival_windows_count = {"now": 0, "soon": 0, "later": 0}
 last_checkin_by_code: dict[str, float] = {}
+# (scan time, code) min-heap so expired cooldown entries can be pruned oldest-first
+_checkin_heap: list[tuple[float, str]] = []
+# Encoded QR PNGs keyed by "pid|token" (a patient's QR payload never changes once issued).
+_qr_cache: dict[str, bytes] = {}
+_QR_CACHE_MAX = 512
 WS_CLIENTS: set[WebSocket] = set()
+# Cached result of _compute_queue_view(), tagged with the _queue_version it was built at
+_queue_version = 0
+# (active pids, wait map, full staff items, light staff items, public items)
+_QueueView = tuple[list[str], dict[str, int], list[dict[str, Any]], list[dict[str, Any]], list[dict[str, Any]]]
+_queue_view_cache: Optional[tuple[int, _QueueView]] = None
 STATE_LOCK = threading.RLock()
 AUDIT_LOG = deque(maxlen=200)
 LOGIN_ATTEMPTS_BY_IP: dict[str, list[float]] = {}
+_iso_cache: tuple[int, str] = (0, "")
+
+
+def _now_iso() -> str:
+    """Current UTC time as ISO-8601, second resolution; the string is rebuilt at most once per second."""
+    global _iso_cache
+    ts = int(time.time())
+    cached = _iso_cache
+    if cached[0] != ts:
+        cached = (ts, datetime.utcfromtimestamp(ts).isoformat())
+        _iso_cache = cached
+    return cached[1]
 
 
 def _db_conn() -> sqlite3.Connection:
@@ -268,6 +327,17 @@ def _init_db() -> None:
             )
             """
         )
+        # Batch ids already stored, so a batch resent after a lost response isn't inserted twice
+        DB_CONN.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vitals_batches (
+              device_id TEXT,
+              batch_id TEXT,
+              created_at INTEGER,
+              PRIMARY KEY (device_id, batch_id)
+            )
+            """
+        )
         DB_CONN.execute(
             """
             CREATE TABLE IF NOT EXISTS queue_events (
@@ -323,7 +393,12 @@ if _FRONTEND_DIST.is_dir():
     _ASSETS_DIR = _FRONTEND_DIST / "assets"
     if _ASSETS_DIR.is_dir():
         app.mount("/assets", StaticFiles(directory=str(_ASSETS_DIR)), name="assets")
-env = Environment(loader=FileSystemLoader(str(_TEMPLATES_DIR)))
+# Production: compiled templates are cached on disk and never re-stat'ed; development keeps hot reload.
+env = Environment(
+    loader=FileSystemLoader(str(_TEMPLATES_DIR)),
+    bytecode_cache=FileSystemBytecodeCache() if APP_ENV == "production" else None,
+    auto_reload=APP_ENV != "production",
+)
 
 try:
     import cv2  # type: ignore
@@ -331,6 +406,11 @@ except Exception:
     cv2 = None
 
 
+def _mjpeg_part(jpeg: bytes) -> bytes:
+    """One multipart/x-mixed-replace part (boundary "frame") carrying a JPEG."""
+    return b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n"
+
+
 class CameraManager:
     def __init__(self, index: int, width: int, height: int, pipeline: str = "") -> None:
         self.index = index
@@ -340,12 +420,13 @@ class CameraManager:
         self._cap = None
         self._thread: Optional[threading.Thread] = None
         self._running = False
-        self._lock = threading.Lock()
-        self._latest_jpeg: bytes = b""
-        self._last_scan_value = ""
-        self._last_scan_ts = 0.0
+        # (jpeg, mjpeg part, last scan value, last scan ts). Replaced wholesale by the capture
+        # thread; a single reference assignment is atomic, so readers need no lock.
+        self._snapshot: tuple[bytes, bytes, str, float] = (b"", b"", "", 0.0)
         self._last_emitted_value = ""
         self._last_emitted_ts = 0.0
+        self._frame_counter = 0
+        self._last_points = None
         self._detector = cv2.QRCodeDetector() if cv2 is not None else None
 
     def start(self) -> None:
@@ -364,11 +445,24 @@ class CameraManager:
                     cap = cv2.VideoCapture(self.index, api)
                 if cap is None or not cap.isOpened():
                     cap = cv2.VideoCapture(self.index)
+            elif sys.platform.startswith("linux"):
+                # V4L2 directly so the MJPG fourcc below is honoured by the driver
+                api = getattr(cv2, "CAP_V4L2", None)
+                if api is not None:
+                    cap = cv2.VideoCapture(self.index, api)
+                if cap is None or not cap.isOpened():
+                    cap = cv2.VideoCapture(self.index)
             else:
                 cap = cv2.VideoCapture(self.index)
         if cap is None or not cap.isOpened():
             hint = " On macOS: grant Camera access to Terminal (or Python) in System Settings → Privacy & Security → Camera."
             raise RuntimeError(f"Unable to open camera ({self.pipeline or self.index}).{hint}")
+        if not self.pipeline:
+            # Ask USB cameras for compressed MJPG frames (less bus bandwidth than raw YUYV at 720p)
+            try:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            except Exception:
+                pass
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
         try:
@@ -400,8 +494,22 @@ class CameraManager:
 
             decoded = ""
             points = None
-            if self._detector is not None:
-                decoded, points, _ = self._detector.detectAndDecode(frame)
+            self._frame_counter += 1
+            if self._detector is not None and self._frame_counter % 3 == 0:
+                # Detect on a half-size grayscale copy (~6x fewer bytes); go full res only when
+                # a code is located but too small to decode at the reduced size.
+                h, w = frame.shape[:2]
+                small = cv2.cvtColor(cv2.resize(frame, (w // 2, h // 2), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                decoded, points, _ = self._detector.detectAndDecode(small)
+                if points is not None and len(points) > 0:
+                    if decoded:
+                        points = points * 2
+                    else:
+                        decoded, points, _ = self._detector.detectAndDecode(frame)
+                self._last_points = points
+            else:
+                # Keep the overlay steady on frames between detection passes
+                points = self._last_points
 
             now = time.time()
             if points is not None and len(points) > 0:
@@ -418,30 +526,37 @@ class CameraManager:
                     cv2.LINE_AA,
                 )
 
+            jpg_bytes, chunk, scan_value, scan_ts = self._snapshot
             value = (decoded or "").strip()
             if value:
-                with self._lock:
-                    is_new = value != self._last_emitted_value
-                    stale = (now - self._last_emitted_ts) > 3.0
-                    if is_new or stale:
-                        self._last_scan_value = value
-                        self._last_scan_ts = now
-                        self._last_emitted_value = value
-                        self._last_emitted_ts = now
-
-            ok_jpg, jpg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 82])
+                is_new = value != self._last_emitted_value
+                stale = (now - self._last_emitted_ts) > 3.0
+                if is_new or stale:
+                    scan_value = value
+                    scan_ts = now
+                    self._last_emitted_value = value
+                    self._last_emitted_ts = now
+
+            ok_jpg, jpg = cv2.imencode(
+                ".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 82, int(cv2.IMWRITE_JPEG_OPTIMIZE), 0]
+            )
             if ok_jpg:
-                with self._lock:
-                    self._latest_jpeg = jpg.tobytes()
-            time.sleep(0.02)
+                jpg_bytes = jpg.tobytes()
+                chunk = _mjpeg_part(jpg_bytes)
+            self._snapshot = (jpg_bytes, chunk, scan_value, scan_ts)
+            # ~15 fps is plenty for the kiosk preview and keeps JPEG encoding off the CPU budget
+            time.sleep(0.066)
 
     def latest_jpeg(self) -> bytes:
-        with self._lock:
-            return self._latest_jpeg
+        return self._snapshot[0]
+
+    def latest_chunk(self) -> bytes:
+        """Latest frame pre-wrapped as an MJPEG multipart part."""
+        return self._snapshot[1]
 
     def last_scan(self) -> tuple[str, float]:
-        with self._lock:
-            return self._last_scan_value, self._last_scan_ts
+        snap = self._snapshot
+        return snap[2], snap[3]
 
 
 camera_manager: Optional[CameraManager] = None
@@ -470,7 +585,7 @@ def render(name: str, **kwargs: Any) -> str:
 
 def _audit(event_type: str, details: dict[str, Any]) -> None:
     with STATE_LOCK:
-        ts = datetime.utcnow().isoformat()
+        ts = _now_iso()
         event = {"ts": ts, "event_type": event_type, "details": details}
         AUDIT_LOG.append(event)
         DB_CONN.execute(
@@ -485,7 +600,7 @@ def _queue_event(event_type: str, pid: str = "", token: str = "", payload: Optio
     with STATE_LOCK:
         DB_CONN.execute(
             "INSERT INTO queue_events(event_type, pid, token, payload, ts) VALUES(?,?,?,?,?)",
-            (event_type, pid, token, json.dumps(data), datetime.utcnow().isoformat()),
+            (event_type, pid, token, json.dumps(data), _now_iso()),
         )
         DB_CONN.commit()
 
@@ -494,17 +609,22 @@ def _queue_event(event_type: str, pid: str = "", token: str = "", payload: Optio
 # AI module (non-diagnostic)
 # -----------------------------------------------------------------------------
 CLUSTER_KEYWORDS = {
-    "Respiratory": ["cough", "sore throat", "congestion", "runny nose", "sinus", "wheezing", "chest"],
-    "GI": ["nausea", "vomit", "diarrhea", "stomach", "abdominal", "cramp", "constipation"],
-    "Musculoskeletal": ["pain", "joint", "muscle", "sprain", "strain", "back", "neck", "ankle", "knee"],
-    "Dermatology": ["rash", "itch", "skin", "hives", "burn", "wound", "bite"],
+    "Respiratory": ("cough", "sore throat", "congestion", "runny nose", "sinus", "wheezing", "chest"),
+    "GI": ("nausea", "vomit", "diarrhea", "stomach", "abdominal", "cramp", "constipation"),
+    "Musculoskeletal": ("pain", "joint", "muscle", "sprain", "strain", "back", "neck", "ankle", "knee"),
+    "Dermatology": ("rash", "itch", "skin", "hives", "burn", "wound", "bite"),
 }
 
-RED_FLAG_KEYWORDS = [
+RED_FLAG_KEYWORDS = (
     "chest pain", "difficulty breathing", "can't breathe", "trouble breathing",
     "having trouble breathing", "shortness of breath", "unconscious", "seizure",
     "bleeding heavily", "stroke", "heart attack", "anaphylaxis", "overdose",
-]
+)
+
+_DUR_NUM_RE = re.compile(r"(\d+)")
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF]")
+_SPLIT_RE = re.compile(r"[,\n]+")
+_WORD_RE = re.compile(r"[a-zA-Z]{3,}")
 
 # Triage priority: high = emergency, medium = urgent, low = routine
 PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
@@ -561,7 +681,7 @@ def _classify_priority_from_vitals_and_symptoms(
 
 def _extract_duration_days(duration: str) -> int:
     text = (duration or "").lower()
-    m = re.search(r"(\d+)", text)
+    m = _DUR_NUM_RE.search(text)
     n = int(m.group(1)) if m else 1
     if "week" in text:
         return n * 7
@@ -574,7 +694,7 @@ def _has_arabic(text: str) -> bool:
     """Detect whether the text contains Arabic characters (rough heuristic)."""
     if not text:
         return False
-    return bool(re.search(r"[\u0600-\u06FF]", text))
+    return bool(_ARABIC_RE.search(text))
 
 
 def _parse_age_from_dob(dob: str) -> Optional[int]:
@@ -590,20 +710,34 @@ def _parse_age_from_dob(dob: str) -> Optional[int]:
 
 
 def ai_structure_symptoms(symptoms: str, duration: str, age_optional: Optional[int], lang: str = "en") -> dict[str, Any]:
+    # Pure in its arguments, so repeat submissions (demo seed, retries) hit the cache.
+    # Callers get their own copy since the result is stored on the patient record.
+    return copy.deepcopy(_ai_structure_symptoms_cached(symptoms, duration, age_optional, lang))
+
+
+@functools.lru_cache(maxsize=1024)
+def _ai_structure_symptoms_cached(symptoms: str, duration: str, age_optional: Optional[int], lang: str) -> dict[str, Any]:
     text = (symptoms or "").lower().strip()
-    symptom_list = [s.strip().capitalize() for s in re.split(r"[,\n]+", symptoms) if s.strip()][:6]
+    symptom_list = [s.strip().capitalize() for s in _SPLIT_RE.split(symptoms) if s.strip()][:6]
     if not symptom_list and text:
         symptom_list = [text[:60].capitalize()]
 
-    scores = {k: sum(1 for w in words if w in text) for k, words in CLUSTER_KEYWORDS.items()}
+    # Tokenize once: the word list gives the symptom count. Keywords still match as substrings
+    # ("sprain" also counts "pain"); with no words at all, no keyword can match, so skip the scan.
+    tokens = _WORD_RE.findall(text)
+    if tokens:
+        scores = {k: sum(1 for w in words if w in text) for k, words in CLUSTER_KEYWORDS.items()}
+        flags = [f for f in RED_FLAG_KEYWORDS if f in text]
+    else:
+        scores = dict.fromkeys(CLUSTER_KEYWORDS, 0)
+        flags = []
     ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     primary = ranked[0][0] if ranked and ranked[0][1] > 0 else "General"
     secondary = ranked[1][0] if len(ranked) > 1 and ranked[1][1] > 0 else ""
     cluster = primary if not secondary else f"{primary}+{secondary}"
 
-    flags = [f for f in RED_FLAG_KEYWORDS if f in text]
     days = _extract_duration_days(duration)
-    symptom_count = len(re.findall(r"[a-zA-Z]{3,}", text))
+    symptom_count = len(tokens)
 
     if flags or symptom_count > 35 or days > 10:
         complexity = "High"
@@ -664,48 +798,69 @@ def ai_structure_symptoms(symptoms: str, duration: str, age_optional: Optional[i
 # Helpers
 # -----------------------------------------------------------------------------
 def next_pid() -> str:
-    return uuid.uuid4().hex[:8].upper()
+    # Random (not sequential) so pids in public QR URLs can't be enumerated.
+    return secrets.token_hex(4).upper()
 
 
 def next_token() -> str:
+    # Tokens are the credential on the public kiosk/vitals/triage endpoints, so they are drawn at
+    # random like pids: holding one ticket must not reveal its neighbours.
     with STATE_LOCK:
-        existing = {str(p.get("token", "")).upper() for p in patients.values()}
+        # issued_tokens is the source of truth for minted tokens (cleared only on reset)
         for _ in range(500):
-            candidate = f"UC-{random.randint(1000, 9999)}"
-            if candidate not in existing and candidate not in issued_tokens:
+            candidate = f"UC-{1000 + secrets.randbelow(9000)}"
+            if candidate not in issued_tokens:
                 issued_tokens.add(candidate)
                 return candidate
-        fallback = f"UC-{uuid.uuid4().hex[:4].upper()}"
+        fallback = f"UC-{secrets.token_hex(2).upper()}"
         issued_tokens.add(fallback)
         return fallback
 
 
+def _display_name(first: Optional[str], last: Optional[str]) -> str:
+    """Full name as shown to staff; also cached on each patient as _full_name at creation."""
+    return f"{(first or '').strip()} {(last or '').strip()}".strip() or "Unknown Patient"
+
+
 def full_name(patient: dict[str, Any]) -> str:
-    first = (patient.get("first_name") or "").strip()
-    last = (patient.get("last_name") or "").strip()
-    return f"{first} {last}".strip() or "Unknown Patient"
+    cached = patient.get("_full_name")
+    if cached:
+        return cached
+    return _display_name(patient.get("first_name"), patient.get("last_name"))
+
+
+_STATUS_LABELS = {"waiting": "Waiting", "called": "Called", "in_room": "In Room", "done": "Complete", "pending": "Pending"}
 
 
 def status_label(status: str) -> str:
-    labels = {"waiting": "Waiting", "called": "Called", "in_room": "In Room", "done": "Complete", "pending": "Pending"}
-    return labels.get(status, status.title())
+    return _STATUS_LABELS.get(status, status.title())
+
+
+def _index_patient_codes(pid: str, token: str) -> None:
+    """Register a new patient's token and QR payload ("PID|TOKEN") for _resolve_code. Call with STATE_LOCK held."""
+    token = token.upper()
+    _token_to_pid[token] = pid
+    _token_to_pid[f"{pid}|{token}"] = pid
 
 
 def _resolve_code(code: str) -> Optional[str]:
     raw = (code or "").strip().upper()
     if not raw:
         return None
-    candidates = [raw]
-    if "|" in raw:
-        parts = [x.strip() for x in raw.split("|") if x.strip()]
-        candidates = parts + [raw]
-
     with STATE_LOCK:
-        for c in candidates:
-            if c in patients:
-                return c
-            for pid, p in patients.items():
-                if str(p.get("token", "")).upper() == c:
+        if raw in patients:
+            return raw
+        pid = _token_to_pid.get(raw)
+        if pid:
+            return pid
+        if "|" in raw:
+            # Hand-typed or padded QR payloads ("PID | TOKEN") miss the exact index entry
+            for part in raw.split("|"):
+                c = part.strip()
+                if c in patients:
+                    return c
+                pid = _token_to_pid.get(c)
+                if pid:
                     return pid
     return None
 
@@ -723,86 +878,97 @@ def _simulate_wait_map(pids: list[str], providers: int) -> dict[str, int]:
     if not pids:
         return {}
     providers = max(1, providers)
-    slots = [0] * max(1, providers)
+    # Min-heap of (cumulative load, provider index): least-loaded provider pops first.
+    heap = [(0, i) for i in range(providers)]
+    heapq.heapify(heap)
     wait: dict[str, int] = {}
+    fast_queue: deque[tuple[str, int]] = deque()
+    other_queue: deque[tuple[str, int]] = deque()
+    get_patient = patients.get
     with STATE_LOCK:
-        with_meta: list[tuple[str, int, str]] = []
         for pid in pids:
-            p = patients.get(pid, {})
-            dur = int(p.get("ai_result", {}).get("estimated_visit_duration_minutes", 20))
-            lane = _lane_from_complexity(p.get("ai_result", {}).get("operational_complexity", ""))
-            with_meta.append((pid, dur, lane))
+            ai = get_patient(pid, {}).get("ai_result", {})
+            dur = int(ai.get("estimated_visit_duration_minutes", 20))
+            lane = _lane_from_complexity(ai.get("operational_complexity", ""))
+            (fast_queue if lane == "Fast" else other_queue).append((pid, dur))
 
-    fast_queue = [x for x in with_meta if x[2] == "Fast"]
-    other_queue = [x for x in with_meta if x[2] != "Fast"]
     has_fast = bool(fast_queue)
+    heapreplace = heapq.heapreplace
     i = 0
     # Reserve at least one out of every three assignment opportunities for Fast lane.
     while fast_queue or other_queue:
         reserve_fast = has_fast and (i % 3 == 0)
         if reserve_fast and fast_queue:
-            pid, dur, _lane = fast_queue.pop(0)
+            pid, dur = fast_queue.popleft()
         elif other_queue:
-            pid, dur, _lane = other_queue.pop(0)
+            pid, dur = other_queue.popleft()
         else:
-            pid, dur, _lane = fast_queue.pop(0)
-        idx = slots.index(min(slots))
-        wait[pid] = slots[idx]
-        slots[idx] += dur
+            pid, dur = fast_queue.popleft()
+        # Least-loaded provider takes the patient; heapreplace pops and pushes in one sift.
+        load, idx = heap[0]
+        wait[pid] = load
+        heapreplace(heap, (load + dur, idx))
         i += 1
     return wait
 
 
 def _queue_active() -> list[str]:
     with STATE_LOCK:
-        return [pid for pid in queue_order if pid in patients and patients[pid].get("status") != "done"]
+        # Copy: callers (and the cached queue view) must not see later in-place reorders
+        return list(queue_order)
 
 
 def _reorder_queue_by_priority() -> None:
     """Sort queue_order by priority (high, medium, low) then by checked_in_at. Call with STATE_LOCK held."""
-    active = [pid for pid in queue_order if pid in patients and patients[pid].get("status") != "done"]
-    done_or_gone = [pid for pid in queue_order if pid not in patients or patients[pid].get("status") == "done"]
     key = lambda pid: (PRIORITY_ORDER.get(patients[pid].get("priority", "low"), 2), patients[pid].get("checked_in_at") or "")
-    active.sort(key=key)
-    queue_order.clear()
-    queue_order.extend(active)
-    queue_order.extend(done_or_gone)
+    queue_order.sort(key=key)
+    _bump()
 
 
-def _public_queue_items() -> list[dict[str, Any]]:
-    active = _queue_active()
-    waits = _simulate_wait_map(active, provider_count)
-    now = datetime.utcnow().isoformat()
-    out = []
+def _bump() -> None:
+    """Invalidate the cached queue view. Call after changing queue order, patient status/priority, providers or vitals."""
+    global _queue_version
+    with STATE_LOCK:
+        _queue_version += 1
+
+
+def _compute_queue_view() -> _QueueView:
+    """
+    Build (active pids, wait map, staff items, light staff items, public items) in one pass over the active queue.
+    Cached until the next _bump(); public items omit updated_at, which is stamped per read.
+    """
+    global _queue_view_cache
     with STATE_LOCK:
+        if _queue_view_cache is not None and _queue_view_cache[0] == _queue_version:
+            return _queue_view_cache[1]
+        version = _queue_version
+        active = _queue_active()
+        waits = _simulate_wait_map(active, provider_count)
+        staff_items: list[dict[str, Any]] = []
+        light_items: list[dict[str, Any]] = []
+        public_items: list[dict[str, Any]] = []
         for pos, pid in enumerate(active, start=1):
             p = patients[pid]
-            typical = int(p.get("ai_result", {}).get("estimated_visit_duration_minutes", 20))
-            out.append({
+            ai = p.get("ai_result", {})
+            status = p.get("status", "waiting")
+            label = _STATUS_LABELS.get(status, status.title())
+            priority = p.get("priority", "low")
+            wait = waits.get(pid, 0)
+            typical = int(ai.get("estimated_visit_duration_minutes", 20))
+            public_items.append({
                 "token": p.get("token"),
-                "priority": p.get("priority", "low"),
-                "status_label": status_label(p.get("status", "waiting")),
-                "estimated_wait_min": waits.get(pid, 0),
+                "priority": priority,
+                "status_label": label,
+                "estimated_wait_min": wait,
                 "position_in_line": pos,
                 "providers_active": provider_count,
-                "updated_at": now,
                 "eta_explanation": (
                     f"You're #{pos} in line • {provider_count} provider(s) • "
                     f"Typical visit {typical}-{typical + 10} min"
                 ),
             })
-    return out
-
-
-def _staff_queue_items() -> list[dict[str, Any]]:
-    active = _queue_active()
-    waits = _simulate_wait_map(active, provider_count)
-    out = []
-    with STATE_LOCK:
-        for pid in active:
-            p = patients[pid]
-            ai = p.get("ai_result", {})
             lane = _lane_from_complexity(ai.get("operational_complexity", ""))
+            light_items.append({"id": pid, "status": status, "estimated_wait_min": wait, "lane": lane})
             tags = ["Nurse triage"]
             c = str(ai.get("cluster", ""))
             if "Respiratory" in c:
@@ -811,40 +977,76 @@ def _staff_queue_items() -> list[dict[str, Any]]:
                 tags.append("hydration supplies")
             if ai.get("red_flag_keywords_detected"):
                 tags.append("priority clinician review")
-            out.append({
-            "id": pid,
-            "token": p.get("token"),
-            "priority": p.get("priority", "low"),
-            "emergency_type": p.get("emergency_type", ""),
-            "full_name": full_name(p),
-            "display_name": p.get("first_name", ""),
-            "status": p.get("status", "waiting"),
-            "status_label": status_label(p.get("status", "waiting")),
-            "checked_in_at": p.get("checked_in_at"),
-            "estimated_wait_min": waits.get(pid, 0),
-            "symptoms": p.get("symptoms", ""),
-            "duration_text": p.get("duration_text", ""),
-            "ai_cluster": ai.get("cluster", ""),
-            "ai_complexity": ai.get("operational_complexity", ""),
-            "ai_visit_duration": ai.get("estimated_visit_duration_minutes", 0),
-            "ai_summary": ai.get("ai_summary_text", ""),
-            "red_flags": ai.get("red_flag_keywords_detected", []),
-            "chief_complaint": ai.get("chief_complaint", ""),
-            "symptom_list": ai.get("symptom_list", []),
-            "suggested_resources": ai.get("suggested_resources", []),
-            "lane": lane,
-            "resource_tags": tags,
-            "vitals_latest": _latest_vitals_for_pid(pid),
-        })
-    return out
+            staff_items.append({
+                "id": pid,
+                "token": p.get("token"),
+                "priority": priority,
+                "emergency_type": p.get("emergency_type", ""),
+                "full_name": p["_full_name"],
+                "display_name": p.get("first_name", ""),
+                "status": status,
+                "status_label": label,
+                "checked_in_at": p.get("checked_in_at"),
+                "estimated_wait_min": wait,
+                "symptoms": p.get("symptoms", ""),
+                "duration_text": p.get("duration_text", ""),
+                "ai_cluster": ai.get("cluster", ""),
+                "ai_complexity": ai.get("operational_complexity", ""),
+                "ai_visit_duration": ai.get("estimated_visit_duration_minutes", 0),
+                "ai_summary": ai.get("ai_summary_text", ""),
+                "red_flags": ai.get("red_flag_keywords_detected", []),
+                "chief_complaint": ai.get("chief_complaint", ""),
+                "symptom_list": ai.get("symptom_list", []),
+                "suggested_resources": ai.get("suggested_resources", []),
+                "lane": lane,
+                "resource_tags": tags,
+                "vitals_latest": _latest_vitals_for_pid(pid),
+            })
+        view = (active, waits, staff_items, light_items, public_items)
+        _queue_view_cache = (version, view)
+        return view
+
+
+# Same options FastAPI's ORJSONResponse used: numpy values from the forecast, non-str dict keys
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
 
 
-def _avg_wait(items: list[dict[str, Any]]) -> int:
-    waits = [i["estimated_wait_min"] for i in items if i.get("status") in {"waiting", "called"}]
-    return int(sum(waits) / len(waits)) if waits else 0
+def _orjson_response(payload: Any) -> Response:
+    """JSON response for the polled endpoints, encoded by orjson instead of the stock encoder."""
+    return Response(orjson.dumps(payload, option=_ORJSON_OPTS), media_type="application/json")
 
 
-def _forecast(provider_override: Optional[int] = None) -> dict[str, Any]:
+def _public_queue_items() -> list[dict[str, Any]]:
+    now = _now_iso()
+    return [{**item, "updated_at": now} for item in _compute_queue_view()[4]]
+
+
+def _staff_queue_items_full() -> list[dict[str, Any]]:
+    return list(_compute_queue_view()[2])
+
+
+def _staff_queue_items_light() -> list[dict[str, Any]]:
+    """id/status/estimated_wait_min/lane per active patient, for stats and forecasts. Shared; do not mutate."""
+    return _compute_queue_view()[3]
+
+
+def _queue_stats(items: list[dict[str, Any]]) -> tuple[int, int, int]:
+    """Single pass over queue items: (avg wait of waiting/called, peak wait of all, waiting/called count)."""
+    total = 0
+    n = 0
+    peak = 0
+    for i in items:
+        w = i["estimated_wait_min"]
+        if w > peak:
+            peak = w
+        if i.get("status") in ("waiting", "called"):
+            total += w
+            n += 1
+    return (int(total / n) if n else 0), peak, n
+
+
+def _forecast(provider_override: Optional[int] = None, items: Optional[list[dict[str, Any]]] = None) -> dict[str, Any]:
+    """Project arrivals and waits over the next 2 hours. Pass the caller's (light) staff queue items to avoid refetching them."""
     with STATE_LOCK:
         providers = provider_override or provider_count
         aw_now = arrival_windows_count["now"]
@@ -852,34 +1054,61 @@ def _forecast(provider_override: Optional[int] = None) -> dict[str, Any]:
         aw_later = arrival_windows_count["later"]
     now = datetime.utcnow()
     seed = int(now.strftime("%Y%m%d%H")) * 10 + (now.minute // 6)
-    rng = random.Random(seed)
-    base = [
-        1 + aw_now * 0.4,
-        2 + aw_now * 0.5,
-        3 + aw_soon * 0.7,
-        4 + aw_soon * 0.8,
-        4 + aw_later * 0.6,
-        3 + aw_later * 0.5,
-        2 + aw_later * 0.4,
-        1 + aw_now * 0.3,
-    ]
-    arrivals = [max(0, int(round(v + rng.uniform(-0.4, 0.4)))) for v in base]
+    current_items = items if items is not None else _staff_queue_items_light()
+    current_peak = _queue_stats(current_items)[1]
+    arrivals, future_wait, recommendation = _forecast_projection(
+        max(providers, 1), seed, current_peak, aw_now, aw_soon, aw_later
+    )
+    # Labels step from the same clock read as the seed, so they can't straddle a minute boundary
+    base = now.replace(second=0, microsecond=0)
+    labels = [(base + timedelta(minutes=15 * i)).strftime("%H:%M") for i in range(8)]
+    return {
+        "labels": labels,
+        "arrivals": list(arrivals),
+        "wait_projection": list(future_wait),
+        "recommendation": recommendation,
+    }
+
+
+# Expected arrivals per 15-min step: baseline plus a weight on the now/soon/later intake counts
+_FORECAST_BASE = np.array([1.0, 2.0, 3.0, 4.0, 4.0, 3.0, 2.0, 1.0])
+_FORECAST_WINDOW_WEIGHTS = np.array([
+    [0.4, 0.0, 0.0],
+    [0.5, 0.0, 0.0],
+    [0.0, 0.7, 0.0],
+    [0.0, 0.8, 0.0],
+    [0.0, 0.0, 0.6],
+    [0.0, 0.0, 0.5],
+    [0.0, 0.0, 0.4],
+    [0.3, 0.0, 0.0],
+])
+
+
+@functools.lru_cache(maxsize=32)
+def _forecast_projection(
+    prov: int, seed: int, current_peak: int, aw_now: int, aw_soon: int, aw_later: int
+) -> tuple[tuple[int, ...], tuple[int, ...], str]:
+    """
+    Deterministic for its arguments (the RNG seed is the 6-minute bucket), so repeat
+    analytics polls within a bucket and unchanged queue are served from the cache.
+    """
+    rng = np.random.default_rng(seed)
+    base = _FORECAST_BASE + _FORECAST_WINDOW_WEIGHTS @ np.array([aw_now, aw_soon, aw_later])
+    arrivals = np.maximum(0, np.round(base + rng.uniform(-0.4, 0.4, size=base.size))).astype(int)
     avg_duration = 20
-    current_items = _staff_queue_items()
-    current_peak = max([i["estimated_wait_min"] for i in current_items], default=0)
-    prov = max(providers, 1)
-    future_wait = [max(0, int(current_peak + (sum(arrivals[:i + 1]) * avg_duration / prov) - i * 8)) for i in range(len(arrivals))]
-    peak_with_current = max(future_wait) if future_wait else 0
-    # If we recommend adding a provider, show projected peak *with* one more provider
-    prov_plus_one = prov + 1
-    future_wait_plus_one = [max(0, int(current_peak + (sum(arrivals[:i + 1]) * avg_duration / prov_plus_one) - i * 8)) for i in range(len(arrivals))]
-    peak_with_extra = max(future_wait_plus_one) if future_wait_plus_one else 0
+    # Cumulative arrival load per 15-min step, minus ~8 min of queue drained per step.
+    # Row 0 uses the current provider count; row 1 projects one more provider.
+    cum_load = np.cumsum(arrivals) * avg_duration
+    drained = np.arange(arrivals.size) * 8
+    providers = np.array([[prov], [prov + 1]])
+    waits = np.maximum(0, (current_peak + cum_load / providers - drained).astype(int))
+    future_wait = waits[0]
+    peak_with_current, peak_with_extra = (int(x) for x in waits.max(axis=1))
     if peak_with_current > 45:
         recommendation = f"Add 1 provider for next peak window; projected peak drops to ~{peak_with_extra} min."
     else:
         recommendation = "Current staffing appears stable for projected arrivals."
-    labels = [(datetime.utcnow() + timedelta(minutes=15 * i)).strftime("%H:%M") for i in range(8)]
-    return {"labels": labels, "arrivals": arrivals, "wait_projection": future_wait, "recommendation": recommendation}
+    return tuple(arrivals.tolist()), tuple(future_wait.tolist()), recommendation
 
 
 def _validate_dob(dob: str) -> None:
@@ -906,15 +1135,23 @@ def _seed_demo_patients() -> None:
         ("Mia", "Lee", "Cough with congestion and fatigue", "5 days", "now"),
         ("Ethan", "King", "Back pain and muscle stiffness", "1 week", "later"),
     ]
+        now_iso = _now_iso()
+        # Build the batch first, then apply queue, window counts and DB rows in bulk
+        new_pids: list[str] = []
+        window_deltas: Counter[str] = Counter()
+        patient_rows: list[tuple[Any, ...]] = []
+        vitals_rows: list[tuple[Any, ...]] = []
         for first, last, symptoms, duration, window in samples:
             pid = next_pid()
+            token = next_token()
             age = random.randint(18, 72)
             ai = ai_structure_symptoms(symptoms, duration, age, lang="en")
             patients[pid] = {
             "pid": pid,
-            "token": next_token(),
+            "token": token,
             "first_name": first,
             "last_name": last,
+            "_full_name": _display_name(first, last),
             "phone": "",
             "dob": "",
             "symptoms": symptoms,
@@ -924,54 +1161,40 @@ def _seed_demo_patients() -> None:
             "status": "waiting",
             "priority": "low",
             "emergency_type": "",
-            "created_at": datetime.utcnow().isoformat(),
-            "checked_in_at": datetime.utcnow().isoformat(),
+            "created_at": now_iso,
+            "checked_in_at": now_iso,
         }
-            queue_order.append(pid)
-            arrival_windows_count[window] += 1
-            DB_CONN.execute(
-                """
-                INSERT OR REPLACE INTO patients(pid, token, first_name, last_name, status, created_at, checked_in_at)
-                VALUES(?,?,?,?,?,?,?)
-                """,
-                (
-                    pid,
-                    patients[pid]["token"],
-                    first,
-                    last,
-                    "waiting",
-                    patients[pid]["created_at"],
-                    patients[pid]["checked_in_at"],
-                ),
-            )
+            _index_patient_codes(pid, token)
+            new_pids.append(pid)
+            window_deltas[window] += 1
+            patient_rows.append((pid, token, first, last, "waiting", now_iso, now_iso))
             # Seed one simulated vitals row per demo patient so "Vitals" and Live Vitals panel show data
             spo2 = random.randint(96, 100)
             hr = random.randint(62, 98)
             temp_c = round(random.uniform(36.4, 37.6), 1)
             bp_sys = random.randint(108, 132)
             bp_dia = random.randint(68, 86)
-            ts = datetime.utcnow().isoformat()
-            DB_CONN.execute(
-                """
-                INSERT INTO vitals(pid, token, device_id, spo2, hr, temp_c, bp_sys, bp_dia, confidence, ts, simulated)
-                VALUES(?,?,?,?,?,?,?,?,?,?,?)
-                """,
-                (
-                    pid,
-                    patients[pid]["token"],
-                    "demo-seed",
-                    spo2,
-                    hr,
-                    temp_c,
-                    bp_sys,
-                    bp_dia,
-                    0.9,
-                    ts,
-                    1,
-                ),
-            )
+            vitals_rows.append((pid, token, "demo-seed", spo2, hr, temp_c, bp_sys, bp_dia, 0.9, now_iso, 1))
+        queue_order.extend(new_pids)
+        for window, count in window_deltas.items():
+            arrival_windows_count[window] += count
+        DB_CONN.executemany(
+            """
+            INSERT OR REPLACE INTO patients(pid, token, first_name, last_name, status, created_at, checked_in_at)
+            VALUES(?,?,?,?,?,?,?)
+            """,
+            patient_rows,
+        )
+        DB_CONN.executemany(
+            """
+            INSERT INTO vitals(pid, token, device_id, spo2, hr, temp_c, bp_sys, bp_dia, confidence, ts, simulated)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            vitals_rows,
+        )
         demo_mode = True
         DB_CONN.commit()
+        _bump()
 
 
 def _reset_state() -> None:
@@ -980,13 +1203,18 @@ def _reset_state() -> None:
         patients.clear()
         queue_order.clear()
         issued_tokens.clear()
+        _token_to_pid.clear()
+        _qr_cache.clear()
         last_checkin_by_code.clear()
+        _checkin_heap.clear()
         arrival_windows_count.update({"now": 0, "soon": 0, "later": 0})
         provider_count = 1
         demo_mode = False
         DB_CONN.execute("DELETE FROM patients")
         DB_CONN.execute("DELETE FROM vitals")
+        DB_CONN.execute("DELETE FROM vitals_batches")
         DB_CONN.commit()
+        _bump()
 
 
 def _ensure_encounter_for_pid(pid: str, station_id: str = "kiosk") -> str:
@@ -1006,7 +1234,7 @@ def _ensure_encounter_for_pid(pid: str, station_id: str = "kiosk") -> str:
         # For now we use pid as encounter_id so frontend staff views can
         # address encounters directly by patient id without extra mapping.
         encounter_id = pid
-        now = datetime.utcnow().isoformat()
+        now = _now_iso()
         DB_CONN.execute(
             """
             INSERT INTO encounters(encounter_id, pid, station_id, created_at, checked_in_at, claim_status)
@@ -1173,9 +1401,7 @@ def _build_claim_bundle(encounter_id: str) -> dict[str, Any]:
 
 
 def _wait_for_pid(pid: str) -> int:
-    active = _queue_active()
-    waits = _simulate_wait_map(active, provider_count)
-    return waits.get(pid, 0)
+    return _compute_queue_view()[1].get(pid, 0)
 
 
 def _kiosk_checkin_result(code: str) -> dict[str, Any]:
@@ -1203,12 +1429,14 @@ def _kiosk_checkin_result(code: str) -> dict[str, Any]:
         for key in {pid, token_key}:
             if key:
                 last_checkin_by_code[key] = now
+                heapq.heappush(_checkin_heap, (now, key))
 
-        if len(last_checkin_by_code) > 400:
-            cutoff = now - 60.0
-            for k, ts in list(last_checkin_by_code.items()):
-                if ts < cutoff:
-                    last_checkin_by_code.pop(k, None)
+        # Drop cooldown entries older than a minute; skip heap entries superseded by a newer scan.
+        cutoff = now - 60.0
+        while _checkin_heap and _checkin_heap[0][0] < cutoff:
+            ts, k = heapq.heappop(_checkin_heap)
+            if last_checkin_by_code.get(k) == ts:
+                last_checkin_by_code.pop(k, None)
 
         if p.get("status") != "pending":
             wait = _wait_for_pid(pid)
@@ -1224,11 +1452,12 @@ def _kiosk_checkin_result(code: str) -> dict[str, Any]:
             }
 
         p["status"] = "waiting"
-        p["checked_in_at"] = datetime.utcnow().isoformat()
+        p["checked_in_at"] = _now_iso()
         p["priority"] = p.get("priority", "low")
         p["emergency_type"] = p.get("emergency_type", "")
         if pid not in queue_order:
             queue_order.append(pid)
+        _bump()
         # Ensure encounter row exists and record check-in timestamp for operational analytics/billing.
         encounter_id = _ensure_encounter_for_pid(pid, station_id="kiosk")
         DB_CONN.execute(
@@ -1254,29 +1483,35 @@ def _kiosk_checkin_result(code: str) -> dict[str, Any]:
         }
 
 
+# Session cookie: 10-digit expiry timestamp followed by the unpadded base64url HMAC-SHA256 (43 chars).
+_SESSION_KEY = APP_SECRET_KEY.encode("utf-8")
+_SESSION_TS_LEN = 10
+_SESSION_VALUE_LEN = _SESSION_TS_LEN + 43
+
+
 def _session_signature(expires_ts: int) -> str:
     msg = f"staff:{expires_ts}".encode("utf-8")
-    return hmac.new(APP_SECRET_KEY.encode("utf-8"), msg, hashlib.sha256).hexdigest()
+    digest = hmac.new(_SESSION_KEY, msg, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
 
 
 def _create_staff_session_value() -> str:
     expires_ts = int(time.time() + (STAFF_SESSION_TTL_MINUTES * 60))
-    return f"{expires_ts}.{_session_signature(expires_ts)}"
+    return f"{expires_ts:010d}{_session_signature(expires_ts)}"
 
 
 def _is_staff_authenticated(request: Request) -> bool:
     raw = request.cookies.get(STAFF_SESSION_COOKIE, "")
-    if "." not in raw:
+    if len(raw) != _SESSION_VALUE_LEN:
         return False
-    exp_s, sig = raw.split(".", 1)
-    try:
-        expires_ts = int(exp_s)
-    except Exception:
+    exp_s = raw[:_SESSION_TS_LEN]
+    # isdigit() alone accepts non-ASCII digits such as '²', which int() rejects
+    if not (exp_s.isascii() and exp_s.isdigit()):
         return False
+    expires_ts = int(exp_s)
     if expires_ts < int(time.time()):
         return False
-    expected = _session_signature(expires_ts)
-    return hmac.compare_digest(sig, expected)
+    return hmac.compare_digest(raw[_SESSION_TS_LEN:], _session_signature(expires_ts))
 
 
 def _require_staff(request: Request) -> None:
@@ -1294,13 +1529,9 @@ def _client_ip(request: Request) -> str:
 
 
 def _lane_counts(items: Optional[list[dict[str, Any]]] = None) -> dict[str, int]:
-    data = items if items is not None else _staff_queue_items()
-    counts = {"Fast": 0, "Standard": 0, "Complex": 0}
-    for i in data:
-        lane = i.get("lane", "Standard")
-        if lane in counts:
-            counts[lane] += 1
-    return counts
+    data = items if items is not None else _staff_queue_items_light()
+    counts = Counter(i.get("lane", "Standard") for i in data)
+    return {lane: counts[lane] for lane in ("Fast", "Standard", "Complex")}
 
 
 def _queue_snapshot_payload() -> dict[str, Any]:
@@ -1309,21 +1540,53 @@ def _queue_snapshot_payload() -> dict[str, Any]:
     return {
         "type": "queue_update",
         "provider_count": pc,
-        "updated_at": datetime.utcnow().isoformat(),
+        "updated_at": _now_iso(),
         "items": _public_queue_items(),
     }
 
 
+_BROADCAST_DEBOUNCE_S = 0.15
+_broadcast_pending = False
+_broadcast_tasks: set[asyncio.Task] = set()
+
+
 async def _broadcast_queue_update() -> None:
+    """
+    Schedule a queue broadcast to websocket clients. Calls within the debounce window
+    coalesce into one send, so bursts (bulk status changes, seeding) serialize once.
+    Fan-out is in-process: the queue itself lives in this worker's memory, so the app
+    runs as a single uvicorn worker (see Procfile/Dockerfile/run.sh).
+    """
+    global _broadcast_pending
+    if _broadcast_pending:
+        return
+    _broadcast_pending = True
+    task = asyncio.create_task(_coalesced_broadcast())
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
+
+
+async def _coalesced_broadcast() -> None:
+    global _broadcast_pending
+    try:
+        await asyncio.sleep(_BROADCAST_DEBOUNCE_S)
+    finally:
+        # Clear before snapshotting so changes made during the send schedule a fresh broadcast.
+        _broadcast_pending = False
+    await _send_queue_update()
+
+
+async def _send_queue_update() -> None:
     with STATE_LOCK:
         sockets = list(WS_CLIENTS)
     if not sockets:
         return
-    payload = _queue_snapshot_payload()
+    # Serialize once and fan the same text frame out to every client.
+    message = orjson.dumps(_queue_snapshot_payload()).decode()
     stale: list[WebSocket] = []
     for ws in sockets:
         try:
-            await ws.send_text(json.dumps(payload))
+            await ws.send_text(message)
         except Exception:
             stale.append(ws)
     if stale:
@@ -1355,7 +1618,7 @@ def _lobby_load_score() -> dict[str, Any]:
         level = "Medium"
     else:
         level = "Low"
-    return {"level": level, "queue_size": q, "updated_at": datetime.utcnow().isoformat()}
+    return {"level": level, "queue_size": q, "updated_at": _now_iso()}
 
 
 def _gemini_generate(system_instruction: str, user_text: str) -> Optional[str]:
@@ -1504,24 +1767,23 @@ def _format_patient_wait_context(pid: str) -> Optional[str]:
     """Build context for this patient: wait time, position, priority, status. For AI chat so it can answer wait questions."""
     if not pid:
         return None
-    items = _public_queue_items()
+    active, waits, _staff_items, _light_items, public_items = _compute_queue_view()
     with STATE_LOCK:
-        p = patients.get(pid)
-        if not p:
+        if pid not in patients:
             return None
-        token = p.get("token", "")
-    for item in items:
-        if str(item.get("token", "")).upper() == str(token or "").upper():
-            wait = item.get("estimated_wait_min", 0)
-            pos = item.get("position_in_line")
-            priority = item.get("priority", "low")
-            status = item.get("status_label", "Waiting")
-            parts = [f"Estimated wait for this patient: {int(wait)} minutes"]
-            if pos is not None:
-                parts.append(f"position in line: {pos}")
-            parts.append(f"priority: {priority}")
-            parts.append(f"status: {status}")
-            return ". ".join(parts) + ". Use this to answer wait time and queue questions; also suggest they check the waiting room screen or ask staff for the most up-to-date info."
+    if pid in waits:
+        # Public items are built in active-queue order, so the pid's index is its item
+        item = public_items[active.index(pid)]
+        wait = item.get("estimated_wait_min", 0)
+        pos = item.get("position_in_line")
+        priority = item.get("priority", "low")
+        status = item.get("status_label", "Waiting")
+        parts = [f"Estimated wait for this patient: {int(wait)} minutes"]
+        if pos is not None:
+            parts.append(f"position in line: {pos}")
+        parts.append(f"priority: {priority}")
+        parts.append(f"status: {status}")
+        return ". ".join(parts) + ". Use this to answer wait time and queue questions; also suggest they check the waiting room screen or ask staff for the most up-to-date info."
     with STATE_LOCK:
         p = patients.get(pid)
         if not p:
@@ -1674,6 +1936,7 @@ def intake_submit(
         "token": next_token(),
         "first_name": first_name,
         "last_name": (last_name or "").strip(),
+        "_full_name": _display_name(first_name, last_name),
         "phone": (phone or "").strip(),
         "dob": (dob or "").strip(),
         "symptoms": symptoms,
@@ -1683,9 +1946,10 @@ def intake_submit(
         "status": "pending",
         "priority": "low",
         "emergency_type": "",
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": _now_iso(),
         "checked_in_at": None,
         }
+        _index_patient_codes(pid, patients[pid]["token"])
         arrival_windows_count[window] += 1
         DB_CONN.execute(
             """
@@ -1727,6 +1991,7 @@ def api_intake_submit(body: IntakeRequest):
             "token": next_token(),
             "first_name": first_name,
             "last_name": (body.last_name or "").strip(),
+            "_full_name": _display_name(first_name, body.last_name),
             "phone": (body.phone or "").strip(),
             "dob": (body.dob or "").strip(),
             "symptoms": symptoms,
@@ -1736,9 +2001,10 @@ def api_intake_submit(body: IntakeRequest):
             "status": "pending",
             "priority": "low",
             "emergency_type": "",
-            "created_at": datetime.utcnow().isoformat(),
+            "created_at": _now_iso(),
             "checked_in_at": None,
         }
+        _index_patient_codes(pid, patients[pid]["token"])
         arrival_windows_count[window] += 1
         DB_CONN.execute(
             """
@@ -1787,18 +2053,46 @@ def api_qr(pid: str):
     return {"pid": pid, "token": p["token"], "display_name": display_name}
 
 
+def _make_qr_png(payload: str) -> bytes:
+    """
+    Render a check-in QR as PNG. "PID|TOKEN" is always 16 bytes, which auto-selection settles on
+    version 2 with error level M boosted to Q; pin those so segno skips the search. Mask choice
+    stays automatic (it keeps the code easy for the kiosk camera to read).
+    """
+    try:
+        qr = segno.make_qr(payload, version=2, error="q", boost_error=False, mode="byte")
+    except segno.DataOverflowError:
+        qr = segno.make(payload, error="m", micro=False)
+    # segno writes the PNG itself (no PIL image round-trip); same module size/quiet zone as qrcode.make
+    buf = io.BytesIO()
+    qr.save(buf, kind="png", scale=10, border=4)
+    return buf.getvalue()
+
+
 @app.get("/qr-img/{pid}")
-def qr_image(pid: str):
+def qr_image(request: Request, pid: str):
     with STATE_LOCK:
         if pid not in patients:
             raise HTTPException(404, "Patient not found.")
         payload = f"{pid}|{patients[pid]['token']}"
-    img = qrcode.make(payload)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
-
+        png = _qr_cache.get(payload)
+    etag = '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16] + '"'
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag}
+    # Revalidation: the image is fixed per payload, so a matching ETag needs no body (or render)
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+    if png is None:
+        png = _make_qr_png(payload)
+        with STATE_LOCK:
+            if payload not in _qr_cache and len(_qr_cache) >= _QR_CACHE_MAX:
+                # FIFO eviction: dicts keep insertion order, so the first key is the oldest
+                del _qr_cache[next(iter(_qr_cache))]
+            _qr_cache[payload] = png
+    return Response(content=png, media_type="image/png", headers=headers)
 
 if not _SPA_BUILD:
     @app.get("/kiosk", response_class=HTMLResponse)
@@ -1854,16 +2148,16 @@ def camera_stream():
         one_frame = _camera_placeholder_jpeg()
         if not one_frame:
             raise HTTPException(503, "Camera unavailable.")
-        boundary = b"frame"
-        body = b"--" + boundary + b"\r\nContent-Type: image/jpeg\r\n\r\n" + one_frame + b"\r\n"
-        return StreamingResponse(iter([body]), media_type="multipart/x-mixed-replace; boundary=" + boundary.decode())
+        return StreamingResponse(iter([_mjpeg_part(one_frame)]), media_type="multipart/x-mixed-replace; boundary=frame")
 
-    def frame_generator():
+    async def frame_generator():
+        last = b""
         while True:
-            frame = manager.latest_jpeg()
-            if frame:
-                yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-            time.sleep(0.04)
+            chunk = manager.latest_chunk()
+            if chunk and chunk is not last:
+                yield chunk
+                last = chunk
+            await asyncio.sleep(0.066)
 
     return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
 
@@ -1920,12 +2214,8 @@ def api_triage(token: str = ""):
     if not raw:
         raise HTTPException(400, "token required")
     with STATE_LOCK:
-        pid = None
-        for _pid, p in patients.items():
-            if str(p.get("token", "")).upper() == raw:
-                pid = _pid
-                break
-        if not pid:
+        pid = _token_to_pid.get(raw)
+        if not pid or pid not in patients:
             raise HTTPException(404, "Patient not found.")
         p = patients[pid]
         vitals = _latest_vitals_for_pid(pid)
@@ -1975,7 +2265,7 @@ async def api_vitals_submit(
         p = patients.get(resolved_pid)
         if not p:
             raise HTTPException(404, "Patient not found.")
-        vitals_ts = ts or datetime.utcnow().isoformat()
+        vitals_ts = ts or _now_iso()
         DB_CONN.execute(
             """
             INSERT INTO vitals(pid, token, device_id, spo2, hr, temp_c, bp_sys, bp_dia, confidence, ts, simulated)
@@ -1996,6 +2286,7 @@ async def api_vitals_submit(
             ),
         )
         DB_CONN.commit()
+        _bump()
     _audit("vitals_submit", {"pid": resolved_pid, "token": p.get("token"), "device_id": device_id})
     await _broadcast_queue_update()
     return {"ok": True, "pid": resolved_pid, "token": p.get("token"), "ts": vitals_ts}
@@ -2012,7 +2303,7 @@ async def api_vitals_submit_json(body: VitalsSubmitRequest):
         p = patients.get(resolved_pid)
         if not p:
             raise HTTPException(404, "Patient not found.")
-        vitals_ts = (body.ts or "").strip() or datetime.utcnow().isoformat()
+        vitals_ts = (body.ts or "").strip() or _now_iso()
         DB_CONN.execute(
             """
             INSERT INTO vitals(pid, token, device_id, spo2, hr, temp_c, bp_sys, bp_dia, confidence, ts, simulated)
@@ -2033,11 +2324,144 @@ async def api_vitals_submit_json(body: VitalsSubmitRequest):
             ),
         )
         DB_CONN.commit()
+        _bump()
     _audit("vitals_submit", {"pid": resolved_pid, "token": p.get("token"), "device_id": body.device_id})
     await _broadcast_queue_update()
     return {"ok": True, "pid": resolved_pid, "token": p.get("token"), "ts": vitals_ts}
 
 
+# Stored batch ids are kept this long; the bridge stops resending a batch well before (60s)
+VITALS_BATCH_ID_TTL_S = 86400
+
+
+def _store_vitals_samples(
+    resolved_pid: str, device_id: str, samples: list[VitalsSample], batch_id: str = ""
+) -> Optional[tuple[str, list[tuple]]]:
+    """
+    Insert readings for one patient in a single pass. Returns (token, rows), or None if the patient
+    is gone. rows is empty when batch_id was already stored (a resend); nothing is inserted then.
+    """
+    with STATE_LOCK:
+        p = patients.get(resolved_pid)
+        if not p:
+            return None
+        token = p.get("token", "")
+        if batch_id:
+            now_s = int(time.time())
+            DB_CONN.execute("DELETE FROM vitals_batches WHERE created_at < ?", (now_s - VITALS_BATCH_ID_TTL_S,))
+            cur = DB_CONN.execute(
+                "INSERT OR IGNORE INTO vitals_batches(device_id, batch_id, created_at) VALUES(?,?,?)",
+                (device_id, batch_id, now_s),
+            )
+            if cur.rowcount == 0:
+                DB_CONN.commit()
+                return token, []
+        now = _now_iso()
+        rows = [
+            (
+                resolved_pid,
+                token,
+                device_id,
+                s.spo2,
+                s.hr,
+                s.temp_c,
+                s.bp_sys,
+                s.bp_dia,
+                s.confidence,
+                (s.ts or "").strip() or now,
+                1 if s.simulated else 0,
+            )
+            for s in samples
+        ]
+        DB_CONN.executemany(
+            """
+            INSERT INTO vitals(pid, token, device_id, spo2, hr, temp_c, bp_sys, bp_dia, confidence, ts, simulated)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            rows,
+        )
+        DB_CONN.commit()
+        _bump()
+    return token, rows
+
+
+@app.post("/api/vitals/submit/batch")
+async def api_vitals_submit_batch(body: VitalsBatchRequest):
+    """Batch endpoint for sensor bridge: many readings, one insert pass, one queue broadcast."""
+    if not body.samples:
+        raise HTTPException(400, "samples is required.")
+    code = (body.pid or body.token or "").strip()
+    resolved_pid = _resolve_code(code)
+    if not resolved_pid:
+        raise HTTPException(404, "Patient not found.")
+    device_id = body.device_id or "sensors"
+    stored = _store_vitals_samples(resolved_pid, device_id, body.samples, body.batch_id)
+    if stored is None:
+        raise HTTPException(404, "Patient not found.")
+    token, rows = stored
+    if not rows:
+        return {"ok": True, "pid": resolved_pid, "token": token, "count": 0, "duplicate": True}
+    _audit("vitals_submit", {"pid": resolved_pid, "token": token, "device_id": device_id, "count": len(rows)})
+    await _broadcast_queue_update()
+    return {"ok": True, "pid": resolved_pid, "token": token, "count": len(rows), "ts": rows[-1][9]}
+
+
+@app.websocket("/api/vitals/stream")
+async def ws_vitals_stream(websocket: WebSocket, token: str = "", pid: str = "", device_id: str = "sensors"):
+    """
+    Persistent vitals stream for the sensor bridge (opt-in alternative to POST batches).
+    Each frame is one reading, a JSON list of readings, or {"batch_id": ..., "samples": [...]}
+    (deduplicated like the batch POST) for the patient named in the query.
+    Every frame is answered: {"ok":true,"count":n} once stored, or an error reply for a bad frame.
+    An unknown patient closes the socket with code 4404.
+    """
+    await websocket.accept()
+    resolved_pid = _resolve_code((pid or token).strip())
+    if not resolved_pid:
+        await websocket.close(code=4404, reason="Patient not found.")
+        return
+    device_id = device_id or "sensors"
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            # Text or binary frames are both accepted; orjson parses either
+            frame = message.get("text") or message.get("bytes") or b""
+            try:
+                data = orjson.loads(frame)
+                batch_id = ""
+                if isinstance(data, dict) and "samples" in data:
+                    batch_id = str(data.get("batch_id") or "")[:64]
+                    data = data["samples"]
+                items = data if isinstance(data, list) else [data]
+            except (orjson.JSONDecodeError, TypeError, ValueError):
+                await websocket.send_text('{"ok":false,"error":"Invalid vitals frame."}')
+                continue
+            # Size check before validation, so an oversized frame isn't parsed sample by sample
+            if not items or len(items) > VITALS_BATCH_MAX:
+                await websocket.send_text(f'{{"ok":false,"error":"Send 1 to {VITALS_BATCH_MAX} samples per frame."}}')
+                continue
+            try:
+                samples = [VitalsSample(**item) for item in items]
+            except (TypeError, ValueError):
+                await websocket.send_text('{"ok":false,"error":"Invalid vitals frame."}')
+                continue
+            stored = _store_vitals_samples(resolved_pid, device_id, samples, batch_id)
+            if stored is None:
+                await websocket.close(code=4404, reason="Patient not found.")
+                return
+            vitals_token, rows = stored
+            if not rows:
+                await websocket.send_text('{"ok":true,"count":0,"duplicate":true}')
+                continue
+            _audit("vitals_submit", {"pid": resolved_pid, "token": vitals_token, "device_id": device_id, "count": len(rows)})
+            await websocket.send_text(f'{{"ok":true,"count":{len(rows)}}}')
+            await _broadcast_queue_update()
+    except WebSocketDisconnect:
+        return
+
+
 @app.get("/api/vitals/{pid}")
 def api_vitals_pid(request: Request, pid: str):
     _require_staff(request)
@@ -2082,12 +2506,12 @@ async def api_vitals_simulate(request: Request, pid: str = Form("")):
         bp_dia=float(bp_dia),
         confidence=0.89,
         simulated=1,
-        ts=datetime.utcnow().isoformat(),
+        ts=_now_iso(),
     )
 
 
 @app.post("/api/insurance/eligibility-check")
-def api_insurance_eligibility_check(body: InsuranceEligibilityRequest):
+async def api_insurance_eligibility_check(body: InsuranceEligibilityRequest):
     """
     Run an insurance eligibility/benefits check for this encounter/patient.
 
@@ -2143,7 +2567,7 @@ def api_insurance_eligibility_check(body: InsuranceEligibilityRequest):
         "consent": bool(body.consent),
     }
 
-    now = datetime.utcnow().isoformat()
+    now = _now_iso()
     with STATE_LOCK:
         cur = DB_CONN.execute(
             """
@@ -2196,7 +2620,7 @@ def api_insurance_eligibility_check(body: InsuranceEligibilityRequest):
         },
         "insurance": insurance_payload,
     }
-    adapter_result = adapter.submit_eligibility_check(adapter_request)
+    adapter_result = await adapter.submit_eligibility_check_async(adapter_request)
 
     eligible_val = adapter_result.get("eligible", None)
     if eligible_val is True:
@@ -2210,7 +2634,7 @@ def api_insurance_eligibility_check(body: InsuranceEligibilityRequest):
     auth_required = (adapter_result.get("authorization_required") or "unknown") or "unknown"
 
     status = "completed"
-    created_at = datetime.utcnow().isoformat()
+    created_at = _now_iso()
     with STATE_LOCK:
         cur = DB_CONN.execute(
             """
@@ -2298,7 +2722,7 @@ def api_claims_bundle(request: Request, encounter_id: str):
     """
     _require_staff(request)
     bundle = _build_claim_bundle(encounter_id)
-    created_at = datetime.utcnow().isoformat()
+    created_at = _now_iso()
     bundle_json = json.dumps(bundle, ensure_ascii=False)
     with STATE_LOCK:
         cur = DB_CONN.execute(
@@ -2322,7 +2746,7 @@ def api_claims_bundle(request: Request, encounter_id: str):
 
 
 @app.post("/api/claims/submit/{encounter_id}")
-def api_claims_submit(request: Request, encounter_id: str):
+async def api_claims_submit(request: Request, encounter_id: str):
     """
     Submit the claim bundle for this encounter via the configured adapter.
 
@@ -2331,10 +2755,10 @@ def api_claims_submit(request: Request, encounter_id: str):
     _require_staff(request)
     bundle = _build_claim_bundle(encounter_id)
     adapter: InsuranceAdapter = get_insurance_adapter(INSURANCE_ADAPTER_NAME)
-    adapter_result = adapter.submit_claim_bundle(bundle)
+    adapter_result = await adapter.submit_claim_bundle_async(bundle)
     claim_id = str(adapter_result.get("claim_id") or "")
     status = str(adapter_result.get("status") or "submitted")
-    now = datetime.utcnow().isoformat()
+    now = _now_iso()
     bundle_json = json.dumps(bundle, ensure_ascii=False)
     with STATE_LOCK:
         cur_bundle = DB_CONN.execute(
@@ -2443,14 +2867,14 @@ def api_ai_chat(request: Request, pid: str = Form(""), message: str = Form(""),
         vitals_context = _format_vitals_context(v)
         patient_wait_context = _format_patient_wait_context(resolved_pid)
     out = _ai_chat_reply(text, vitals_context=vitals_context, patient_wait_context=patient_wait_context)
+    now = _now_iso()
     with STATE_LOCK:
-        DB_CONN.execute(
+        DB_CONN.executemany(
             "INSERT INTO ai_conversations(pid, role, message, ts) VALUES(?,?,?,?)",
-            (resolved_pid or "", role, text, datetime.utcnow().isoformat()),
-        )
-        DB_CONN.execute(
-            "INSERT INTO ai_conversations(pid, role, message, ts) VALUES(?,?,?,?)",
-            (resolved_pid or "", "assistant", out["reply"], datetime.utcnow().isoformat()),
+            [
+                (resolved_pid or "", role, text, now),
+                (resolved_pid or "", "assistant", out["reply"], now),
+            ],
         )
         DB_CONN.commit()
     return {
@@ -2607,7 +3031,7 @@ if not _SPA_BUILD:
 
 @app.get("/api/queue")
 def api_public_queue():
-    return _public_queue_items()
+    return _orjson_response(_public_queue_items())
 
 
 @app.websocket("/ws/queue")
@@ -2615,10 +3039,10 @@ async def ws_queue(websocket: WebSocket):
     await websocket.accept()
     with STATE_LOCK:
         WS_CLIENTS.add(websocket)
-    await websocket.send_text(json.dumps(_queue_snapshot_payload()))
+    await websocket.send_text(orjson.dumps(_queue_snapshot_payload()).decode())
     try:
         while True:
-            await websocket.send_text(json.dumps({"type": "ping", "ts": datetime.utcnow().isoformat()}))
+            await websocket.send_text(orjson.dumps({"type": "ping", "ts": _now_iso()}).decode())
             await asyncio.sleep(20)
     except WebSocketDisconnect:
         with STATE_LOCK:
@@ -2641,16 +3065,17 @@ if not _SPA_BUILD:
 @app.get("/api/staff-queue")
 def api_staff_queue(request: Request):
     _require_staff(request)
-    items = _staff_queue_items()
+    items = _staff_queue_items_full()
     with STATE_LOCK:
         pc = provider_count
-    return {
+    avg_wait, _, _ = _queue_stats(items)
+    return _orjson_response({
         "provider_count": pc,
-        "avg_wait_min": _avg_wait(items),
+        "avg_wait_min": avg_wait,
         "lane_counts": _lane_counts(items),
-        "updated_at": datetime.utcnow().isoformat(),
+        "updated_at": _now_iso(),
         "items": items,
-    }
+    })
 
 
 @app.post("/api/staff/status/{pid}")
@@ -2662,10 +3087,11 @@ async def api_staff_status(request: Request, pid: str, status: str = Form(...)):
         if status not in {"called", "in_room", "done"}:
             raise HTTPException(400, "Invalid status.")
         patients[pid]["status"] = status
-        if status == "done":
-            queue_order[:] = [x for x in queue_order if x != pid]
+        if status == "done" and pid in queue_order:
+            queue_order.remove(pid)
         DB_CONN.execute("UPDATE patients SET status=? WHERE pid=?", (status, pid))
         DB_CONN.commit()
+        _bump()
     _audit("status_change", {"pid": pid, "status": status})
     _queue_event("status_change", pid=pid, token=patients.get(pid, {}).get("token", ""), payload={"status": status})
     await _broadcast_queue_update()
@@ -2679,6 +3105,7 @@ async def api_provider_count(request: Request, count: int = Form(...)):
     with STATE_LOCK:
         provider_count = min(3, max(1, int(count)))
         pc = provider_count
+        _bump()
     _audit("provider_count_change", {"provider_count": pc})
     _queue_event("provider_count_change", payload={"provider_count": pc})
     await _broadcast_queue_update()
@@ -2705,16 +3132,17 @@ def api_analytics(request: Request, providers: Optional[int] = None):
     with STATE_LOCK:
         current_provider = provider_count
     providers = min(3, max(1, providers or current_provider))
-    forecast = _forecast(providers)
-    items = _staff_queue_items()
-    return {
+    items = _staff_queue_items_light()
+    forecast = _forecast(providers, items)
+    avg_wait, peak_wait, _ = _queue_stats(items)
+    return _orjson_response({
         "provider_count": providers,
         "current_queue": len(items),
-        "current_avg_wait": _avg_wait(items),
-        "current_peak_wait": max([i["estimated_wait_min"] for i in items], default=0),
+        "current_avg_wait": avg_wait,
+        "current_peak_wait": peak_wait,
         "lane_counts": _lane_counts(items),
         "forecast": forecast,
-    }
+    })
 
 
 @app.post("/demo/seed")
@@ -2858,6 +3286,10 @@ def shutdown_camera_manager():
 @app.on_event("startup")
 def startup_init():
     _init_db()
+    if not _SPA_BUILD:
+        # Compile every template up front so the first page view doesn't pay for it
+        for name in env.list_templates(extensions=["html"]):
+            env.get_template(name)
     if DEMO_MODE_FLAG:
         _seed_demo_patients()
 
@@ -10,6 +10,10 @@ Design goals:
 
 from __future__ import annotations
 
+import asyncio
+import copy
+import hashlib
+import json
 import random
 import time
 from typing import Any, Dict, Protocol
@@ -47,6 +51,21 @@ class InsuranceAdapter(Protocol):
         - status: str
         """
 
+    # Async variants for event-loop callers; same contract as the sync methods above.
+    async def submit_eligibility_check_async(self, payload: dict[str, Any]) -> dict[str, Any]:
+        ...
+
+    async def submit_claim_bundle_async(self, bundle: dict[str, Any]) -> dict[str, Any]:
+        ...
+
+    async def check_claim_status_async(self, claim_id: str) -> dict[str, Any]:
+        ...
+
+
+def _stable_hash(text: str) -> int:
+    """16-bit hash that, unlike built-in hash(), is the same across processes (no PYTHONHASHSEED salt)."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=2).digest(), "big")
+
 
 class MockNphiesAdapter:
     """
@@ -56,23 +75,30 @@ class MockNphiesAdapter:
     the rest of the system can be exercised without live NPHIES access.
     """
 
+    # Max remembered eligibility responses; oldest evicted first
+    ELIGIBILITY_CACHE_MAX = 256
+
     def __init__(self, latency_ms: int = 400) -> None:
         self.latency_ms = latency_ms
+        self._eligibility_cache: dict[str, dict[str, Any]] = {}
 
     def _sleep(self) -> None:
         if self.latency_ms <= 0:
             return
         time.sleep(self.latency_ms / 1000.0)
 
-    def submit_eligibility_check(self, payload: dict[str, Any]) -> dict[str, Any]:
-        self._sleep()
-        seed = hash(repr(payload)) & 0xFFFF
-        rng = random.Random(seed)
+    async def _asleep(self) -> None:
+        if self.latency_ms <= 0:
+            return
+        await asyncio.sleep(self.latency_ms / 1000.0)
+
+    def _eligibility_result(self, key: str, payload: dict[str, Any]) -> dict[str, Any]:
+        rng = random.Random(_stable_hash(key))
         eligible_flag = rng.choice([True, True, True, False])  # skew towards eligible
         plan_type = rng.choice(["Basic", "Standard", "Premium"])
         copay = rng.choice([0.0, 10.0, 20.0, 50.0])
         auth_required = rng.choice(["no", "no", "unknown", "yes"])
-        return {
+        result = {
             "adapter": "mock",
             "eligible": eligible_flag,
             "plan_type": plan_type,
@@ -82,11 +108,14 @@ class MockNphiesAdapter:
                 "echo_payload": payload,
             },
         }
+        if len(self._eligibility_cache) >= self.ELIGIBILITY_CACHE_MAX:
+            self._eligibility_cache.pop(next(iter(self._eligibility_cache), None), None)
+        self._eligibility_cache[key] = copy.deepcopy(result)
+        return result
 
-    def submit_claim_bundle(self, bundle: dict[str, Any]) -> dict[str, Any]:
-        self._sleep()
+    def _claim_result(self, bundle: dict[str, Any]) -> dict[str, Any]:
         enc_id = str(bundle.get("encounter_id") or "")
-        suffix = hex(abs(hash(enc_id)) & 0xFFFF)[2:].upper() or "MOCK"
+        suffix = hex(_stable_hash(enc_id))[2:].upper() or "MOCK"
         claim_id = f"MOCK-{suffix}"
         status = "submitted"
         return {
@@ -96,10 +125,9 @@ class MockNphiesAdapter:
             "raw": {"echo_bundle_meta": {"encounter_id": enc_id}},
         }
 
-    def check_claim_status(self, claim_id: str) -> dict[str, Any]:
-        self._sleep()
+    def _claim_status_result(self, claim_id: str) -> dict[str, Any]:
         # Simple deterministic status progression based on hash
-        h = abs(hash(claim_id)) % 100
+        h = _stable_hash(claim_id) % 100
         if h < 10:
             status = "rejected"
         elif h < 40:
@@ -112,6 +140,50 @@ class MockNphiesAdapter:
             "status": status,
         }
 
+    def submit_eligibility_check(self, payload: dict[str, Any]) -> dict[str, Any]:
+        key = json.dumps(payload, sort_keys=True, default=str)
+        cached = self._eligibility_cache.get(key)
+        if cached is not None:
+            # Identical payload: same deterministic answer, without the simulated round trip
+            return copy.deepcopy(cached)
+        self._sleep()
+        return self._eligibility_result(key, payload)
+
+    async def submit_eligibility_check_async(self, payload: dict[str, Any]) -> dict[str, Any]:
+        key = json.dumps(payload, sort_keys=True, default=str)
+        cached = self._eligibility_cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        await self._asleep()
+        return self._eligibility_result(key, payload)
+
+    def submit_claim_bundle(self, bundle: dict[str, Any]) -> dict[str, Any]:
+        self._sleep()
+        return self._claim_result(bundle)
+
+    async def submit_claim_bundle_async(self, bundle: dict[str, Any]) -> dict[str, Any]:
+        await self._asleep()
+        return self._claim_result(bundle)
+
+    def check_claim_status(self, claim_id: str) -> dict[str, Any]:
+        self._sleep()
+        return self._claim_status_result(claim_id)
+
+    async def check_claim_status_async(self, claim_id: str) -> dict[str, Any]:
+        await self._asleep()
+        return self._claim_status_result(claim_id)
+
+
+# Shared so the mock's eligibility memo survives across requests
+_mock_adapter: MockNphiesAdapter | None = None
+
+
+def _shared_mock_adapter() -> MockNphiesAdapter:
+    global _mock_adapter
+    if _mock_adapter is None:
+        _mock_adapter = MockNphiesAdapter()
+    return _mock_adapter
+
 
 def get_insurance_adapter(adapter_name: str) -> InsuranceAdapter:
     """
@@ -126,9 +198,9 @@ def get_insurance_adapter(adapter_name: str) -> InsuranceAdapter:
     """
     name = (adapter_name or "").strip().lower()
     if not name or name == "mock":
-        return MockNphiesAdapter()
+        return _shared_mock_adapter()
 
     # Placeholder: real NPHIES adapter would go here.
     # For now, fall back to the mock so the rest of the app works.
-    return MockNphiesAdapter()
+    return _shared_mock_adapter()
 
@@ -7,7 +7,8 @@ HOST="${HOST:-0.0.0.0}"
 PORT="${PORT:-8000}"
 
 if [ "$APP_ENV" = "production" ]; then
-  uvicorn app:app --host "$HOST" --port "$PORT"
+  # Single worker: queue state and websocket clients live in this process
+  uvicorn app:app --host "$HOST" --port "$PORT" --workers 1
 else
   uvicorn app:app --reload --host "$HOST" --port "$PORT"
 fi
@@ -10,52 +10,226 @@ Usage:
   export CAREPILOT_TOKEN=UC-1234    # or CAREPILOT_PID=ABC12DEF
   python scripts/sensor_bridge.py
 
-Optional: CAREPILOT_TOKEN_FILE=/path/to/token.txt  (read token from file, one line)
+Optional: CAREPILOT_TOKEN_FILE=/path/to/token.txt  (read token from file, one line; a new
+                                                    token written there is picked up while running)
           CAREPILOT_INTERVAL=10  (seconds between submissions, default 10)
+          CAREPILOT_SAMPLE_HZ=1  (sensor reads per second, default 1)
+          CAREPILOT_BATCH=10  (max readings per submission, default 10)
+          CAREPILOT_DRAIN_MS=500  (sender waits this long for more queued batches to merge)
+          CAREPILOT_MAX_BATCH=500  (cap on readings in one merged POST; server accepts 500)
+          CAREPILOT_MAX_SAMPLE_AGE=60  (failed sends are retried until readings are this old, seconds)
+          CAREPILOT_HEARTBEAT=60  (readings that barely changed are skipped, but one is sent at least
+                                   this often, seconds; 0 sends every reading)
           CAREPILOT_DEVICE_ID=jetson-nano-01
+          CAREPILOT_LOG_FILE=/var/log/carepilot-bridge.log  (rotating log file; stderr if unset)
+          CAREPILOT_LOG_LEVEL=INFO  (WARNING keeps only failures)
+
+Readings are buffered and sent together to /api/vitals/submit/batch once per interval
+(or sooner when the batch fills), so faster sampling doesn't mean more requests.
+
+On Linux with inotify_simple installed (pip install inotify_simple) the token file is
+watched and only re-read when it is rewritten; elsewhere it is stat'ed each sample and
+re-read only when it changed.
+If orjson is installed it is used to encode request bodies (stdlib json otherwise).
+With httpx[http2] installed, submissions go over one multiplexed HTTP/2 connection
+(HTTPS only; set CAREPILOT_HTTP2=0 to use requests instead).
+With CAREPILOT_TRANSPORT=ws (needs pip install websockets) readings go as small frames over
+one long-lived WebSocket to /api/vitals/stream; while it is down or unsupported by the
+server, batches are POSTed as usual.
+
+Runs on Python 3.6+ (the Python that ships with JetPack 4 on the Nano); the optional httpx
+and websockets transports need a newer Python.
 """
 
+import atexit
+import calendar
+import concurrent.futures
 import json
+import logging
+import logging.handlers
 import os
+import queue
 import random
 import sys
+import threading
 import time
-from pathlib import Path
+import urllib.parse
+import uuid
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+except ImportError:
+    httpx = None
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
-    print("Install requests: pip install requests", file=sys.stderr)
-    sys.exit(1)
+    requests = None
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+except ImportError:  # stdlib fallback; same bytes-out shape
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+try:
+    from websockets.exceptions import ConnectionClosed, InvalidHandshake, InvalidStatus
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # not Linux, or not installed: fall back to re-reading the token file
+    INotify = None
+
+# -----------------------------------------------------------------------------
+# Logging: callers only enqueue records; a listener thread does the (possibly slow,
+# e.g. serial console) writes, so logging never stalls sampling or sending.
+# -----------------------------------------------------------------------------
+log = logging.getLogger("carepilot.bridge")
+_LOG_QUEUE: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+
+
+def _setup_logging() -> None:
+    log_file = os.getenv("CAREPILOT_LOG_FILE", "")
+    if log_file:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=3)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(_LOG_QUEUE, handler)
+    listener.start()
+    atexit.register(listener.stop)  # flushes what is still queued
+    log.addHandler(logging.handlers.QueueHandler(_LOG_QUEUE))
+    log.setLevel(os.getenv("CAREPILOT_LOG_LEVEL", "INFO").upper())
+    # Own handler only; library loggers (httpx logs every request at INFO) stay at their defaults
+    log.propagate = False
+
+
+_setup_logging()
 
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
 BASE_URL = os.getenv("CAREPILOT_URL", "http://localhost:8000").rstrip("/")
 INTERVAL = int(os.getenv("CAREPILOT_INTERVAL", "10"))
+SAMPLE_HZ = float(os.getenv("CAREPILOT_SAMPLE_HZ", "1"))
+BATCH_SIZE = max(1, int(os.getenv("CAREPILOT_BATCH", "10")))
+DRAIN_S = max(0.0, float(os.getenv("CAREPILOT_DRAIN_MS", "500")) / 1000.0)
 DEVICE_ID = os.getenv("CAREPILOT_DEVICE_ID", "jetson-01")
+TOKEN_FILE = os.getenv("CAREPILOT_TOKEN_FILE", "")
+TRANSPORT = os.getenv("CAREPILOT_TRANSPORT", "http").strip().lower()
+if TRANSPORT == "ws" and ws_connect is None:
+    log.warning("CAREPILOT_TRANSPORT=ws needs: pip install websockets  (using HTTP)")
+    TRANSPORT = "http"
+
+USE_HTTP2 = httpx is not None and os.getenv("CAREPILOT_HTTP2", "1") == "1"
+if USE_HTTP2:
+    # HTTP/2: in-flight batches share one TLS connection as separate streams.
+    # (Negotiated via ALPN, so plain http:// URLs still speak HTTP/1.1 keep-alive.)
+    CLIENT = httpx.Client(
+        timeout=httpx.Timeout(10.0, connect=3.05),
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+        ),
+    )
+    atexit.register(CLIENT.close)
+elif requests is not None:
+    # One pooled session: keep-alive reuses the TCP/TLS connection across submissions
+    # instead of a fresh handshake every INTERVAL. Connection errors and overloaded/erroring
+    # servers get exponential backoff (0.5s, 1s, 2s, ...), honouring Retry-After.
+    SESSION = requests.Session()
+    _adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+        ),
+    )
+    SESSION.mount("https://", _adapter)
+    SESSION.mount("http://", _adapter)
+    atexit.register(SESSION.close)
+else:
+    log.error("Install requests: pip install requests  (or httpx[http2])")
+    sys.exit(1)
+
+
+_inotify = None
+# Last token-file read, keyed by (mtime_ns, inode, size): the file is only reopened when one changes.
+# The inode catches the receiver's rename-into-place even on filesystems with coarse mtimes.
+_TOKEN_CACHE = {"key": None, "value": ""}
 
 
 def get_token_or_pid() -> str:
-    token_file = os.getenv("CAREPILOT_TOKEN_FILE")
-    if token_file and Path(token_file).exists():
-        with open(token_file) as f:
-            return (f.read() or "").strip()
+    if TOKEN_FILE:
+        try:
+            st = os.stat(TOKEN_FILE)
+        except OSError:
+            st = None
+        if st is not None:
+            key = (st.st_mtime_ns, st.st_ino, st.st_size)
+            if key != _TOKEN_CACHE["key"]:
+                with open(TOKEN_FILE) as f:
+                    _TOKEN_CACHE.update(key=key, value=(f.read() or "").strip())
+            return _TOKEN_CACHE["value"]
     return (os.getenv("CAREPILOT_TOKEN") or os.getenv("CAREPILOT_PID") or "").strip()
 
 
+def watch_token_file() -> None:
+    """Watch the token file's directory for rewrites (close-after-write or rename into place)."""
+    global _inotify
+    if not TOKEN_FILE or INotify is None:
+        return
+    try:
+        inot = INotify()
+        inot.add_watch(os.path.dirname(os.path.abspath(TOKEN_FILE)), inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+    except OSError as e:
+        log.warning("inotify unavailable (%s); checking token file each sample", e)
+        return
+    _inotify = inot
+
+
+def poll_token(current: str) -> str:
+    """Token to use now. With inotify the file is only re-read after an event for it."""
+    if not TOKEN_FILE:
+        return current
+    if _inotify is not None:
+        name = os.path.basename(TOKEN_FILE)
+        if not any(ev.name == name for ev in _inotify.read(timeout=0)):
+            return current
+    # An empty or missing file means no new check-in; keep sending for the current patient
+    return get_token_or_pid() or current
+
+
 # -----------------------------------------------------------------------------
 # Vitals readers (plug in real hardware here)
 # -----------------------------------------------------------------------------
 
+# Private RNG for simulated readings (no contention with other users of the shared `random` module)
+_RNG = random.Random()
+
+
 def read_vitals_simulated() -> dict:
     """Plausible random vitals for testing without hardware."""
+    rng = _RNG
     return {
-        "spo2": round(random.uniform(96, 100), 1),
-        "hr": random.randint(62, 88),
-        "temp_c": round(random.uniform(36.2, 37.2), 1),
-        "bp_sys": random.randint(112, 128),
-        "bp_dia": random.randint(70, 82),
+        "spo2": round(rng.uniform(96, 100), 1),
+        "hr": rng.randint(62, 88),
+        "temp_c": round(rng.uniform(36.2, 37.2), 1),
+        "bp_sys": rng.randint(112, 128),
+        "bp_dia": rng.randint(70, 82),
         "confidence": 0.9,
         "simulated": 1,
     }
@@ -78,64 +252,366 @@ def read_vitals_ds18b20() -> dict:
     return read_vitals_simulated()
 
 
+_READERS = {
+    "max30102": read_vitals_max30102,
+    "ds18b20": read_vitals_ds18b20,
+    "simulated": read_vitals_simulated,
+}
+# CAREPILOT_SENSOR_MODE is a comma-separated list, e.g. "max30102,ds18b20"; unknown names are ignored
+SENSOR_MODES = [
+    m for m in (x.strip() for x in os.getenv("CAREPILOT_SENSOR_MODE", "simulated").lower().split(",")) if m in _READERS
+] or ["simulated"]
+# Independent buses (I2C, 1-Wire) are read in parallel, so a read takes as long as the slowest sensor
+_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="sensor") if len(SENSOR_MODES) > 1 else None
+READ_TIMEOUT_S = 5
+
+
 def read_vitals() -> dict:
-    """Read from sensors. Change to read_vitals_max30102() etc. when hardware is wired."""
-    mode = os.getenv("CAREPILOT_SENSOR_MODE", "simulated").lower()
-    if mode == "max30102":
-        return read_vitals_max30102()
-    if mode == "ds18b20":
-        return read_vitals_ds18b20()
-    return read_vitals_simulated()
+    """Read every configured sensor and merge the results (later modes win on shared fields)."""
+    if _POOL is None:
+        return _READERS[SENSOR_MODES[0]]()
+    futures = [(m, _POOL.submit(_READERS[m])) for m in SENSOR_MODES]
+    merged: dict = {}
+    confidence = []
+    simulated = 0
+    for mode, fut in futures:
+        try:
+            part = fut.result(timeout=READ_TIMEOUT_S)
+        except Exception as e:
+            log.error("Sensor %s read failed: %r", mode, e)
+            continue
+        merged.update(part)
+        confidence.append(part.get("confidence", 0.9))
+        simulated = max(simulated, part.get("simulated", 0))
+    # The merged reading is only as trustworthy as its weakest source
+    merged["confidence"] = min(confidence) if confidence else 0.0
+    merged["simulated"] = simulated
+    return merged
 
 
 # -----------------------------------------------------------------------------
 # Submit to CarePilot
 # -----------------------------------------------------------------------------
 
-def submit_vitals(token_or_pid: str, vitals: dict) -> bool:
-    url = f"{BASE_URL}/api/vitals/submit/json"
+_VITAL_KEYS = ("spo2", "hr", "temp_c", "bp_sys", "bp_dia")
+# Fields that are the same on every request; copied and filled in per submission
+_PAYLOAD_TMPL = {"pid": "", "device_id": DEVICE_ID}
+# Body is pre-serialized (orjson when installed), so the content type is set by hand
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _sample_payload(vitals: dict) -> dict:
+    sample = {
+        "confidence": vitals.get("confidence", 0.9),
+        "simulated": vitals.get("simulated", 0),
+        "ts": vitals.get("ts", ""),
+    }
+    # Readers may omit or null out fields they don't measure; only send what was read
+    sample.update({k: vitals[k] for k in _VITAL_KEYS if vitals.get(k) is not None})
+    return sample
+
+
+def _post(url: str, body: bytes):
+    """POST a pre-encoded JSON body with whichever client is configured; returns the response."""
+    if USE_HTTP2:
+        return CLIENT.post(url, content=body, headers=_JSON_HEADERS)
+    return SESSION.post(url, data=body, headers=_JSON_HEADERS, timeout=(3.05, 10))
+
+
+# Open stream and the token it was opened for (the patient is part of the URL). After a drop,
+# reconnects wait `backoff` seconds (doubling to 60); batches in between go over HTTP.
+_WS = {"conn": None, "token": None, "backoff": 0.0, "retry_at": 0.0, "unsupported": False}
+WS_BACKOFF_MAX_S = 60.0
+# How long to wait for the server to confirm it stored a frame before falling back to POST
+WS_ACK_TIMEOUT_S = 5.0
+
+
+def _ws_close() -> None:
+    conn = _WS["conn"]
+    _WS.update(conn=None, token=None)
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _ws_backoff() -> None:
+    _ws_close()
+    _WS["backoff"] = min(WS_BACKOFF_MAX_S, max(1.0, _WS["backoff"] * 2))
+    _WS["retry_at"] = time.monotonic() + _WS["backoff"]
+
+
+def _ws_open(token_or_pid: str):
+    """Connected stream for this patient, or None when HTTP should be used instead."""
+    if _WS["unsupported"]:
+        return None
+    if _WS["conn"] is not None and _WS["token"] == token_or_pid:
+        return _WS["conn"]
+    _ws_close()
+    if time.monotonic() < _WS["retry_at"]:
+        return None
+    query = urllib.parse.urlencode({"token": token_or_pid, "device_id": DEVICE_ID})
+    url = f"{BASE_URL.replace('http', 'ws', 1)}/api/vitals/stream?{query}"
+    try:
+        # Entered by hand since it outlives this call (newer websockets warn on bare connect()); closed in _ws_close
+        conn = ws_connect(url, open_timeout=5, close_timeout=2).__enter__()
+    except InvalidStatus as e:
+        # Handshake answered without a 101: an older server without the stream endpoint
+        log.warning("WebSocket refused (%s); using HTTP", e.response.status_code)
+        _WS["unsupported"] = True
+        return None
+    except (InvalidHandshake, OSError, TimeoutError) as e:
+        log.warning("WebSocket connect failed: %s; retrying in %gs", e, max(1.0, _WS["backoff"] * 2))
+        _ws_backoff()
+        return None
+    _WS.update(conn=conn, token=token_or_pid, backoff=0.0)
+    return conn
+
+
+def _ws_send(token_or_pid: str, samples: list, batch_id: str):
+    """
+    Send readings as one frame and wait for the server's ack. Returns None unless the server
+    confirmed storing them, so the caller POSTs the batch instead (and retries that if it fails).
+    """
+    conn = _ws_open(token_or_pid)
+    if conn is None:
+        return None
+    try:
+        frame = {"batch_id": batch_id, "samples": [_sample_payload(v) for v in samples]}
+        conn.send(_dumps(frame).decode("utf-8"))
+        reply = json.loads(conn.recv(timeout=WS_ACK_TIMEOUT_S))
+    except ConnectionClosed as e:
+        log.warning("WebSocket closed (%s); reconnecting with backoff", e)
+        _ws_backoff()
+        return None
+    except TimeoutError:
+        # The frame may or may not have been stored; drop the connection so a late ack can't be
+        # mistaken for the next frame's
+        log.warning("No WebSocket ack within %gs; reconnecting with backoff", WS_ACK_TIMEOUT_S)
+        _ws_backoff()
+        return None
+    except ValueError as e:
+        log.error("Bad WebSocket ack: %s", e)
+        _ws_backoff()
+        return None
+    if not (isinstance(reply, dict) and reply.get("ok")):
+        log.error("Stream error: %s", str(reply)[:200])
+        return None
+    return True
+
+
+def submit_vitals(token_or_pid: str, samples: list, batch_id: str = ""):
+    """
+    Send buffered readings (oldest first): one stream frame, or one POST.
+    True when sent, False on a failure worth retrying, None when the server rejected them (4xx).
+    Resends must reuse batch_id: the server skips a batch id it already stored, so a retry after
+    a lost response (read timeout, missed ack) doesn't insert the readings twice.
+    """
+    batch_id = batch_id or uuid.uuid4().hex
+    if TRANSPORT == "ws" and _ws_send(token_or_pid, samples, batch_id):
+        return True
+    url = f"{BASE_URL}/api/vitals/submit/batch"
     # API accepts either token (e.g. UC-1234) or pid (8-char); it resolves the patient
     payload = {
+        **_PAYLOAD_TMPL,
         "token": token_or_pid,
-        "pid": "",
-        "device_id": DEVICE_ID,
-        "confidence": vitals.get("confidence", 0.9),
-        "simulated": vitals.get("simulated", 0),
+        "batch_id": batch_id,
+        "samples": [_sample_payload(v) for v in samples],
     }
-    if vitals.get("spo2") is not None:
-        payload["spo2"] = vitals["spo2"]
-    if vitals.get("hr") is not None:
-        payload["hr"] = vitals["hr"]
-    if vitals.get("temp_c") is not None:
-        payload["temp_c"] = vitals["temp_c"]
-    if vitals.get("bp_sys") is not None:
-        payload["bp_sys"] = vitals["bp_sys"]
-    if vitals.get("bp_dia") is not None:
-        payload["bp_dia"] = vitals["bp_dia"]
     try:
-        r = requests.post(url, json=payload, timeout=10)
+        r = _post(url, _dumps(payload))
         if r.status_code == 200:
             return True
-        print(f"API {r.status_code}: {r.text[:200]}", file=sys.stderr)
+        log.error("API %s: %s", r.status_code, r.text[:200])
+        if 400 <= r.status_code < 500 and r.status_code != 429:
+            return None
     except Exception as e:
-        print(f"Request error: {e}", file=sys.stderr)
+        log.error("Request error: %s", e)
     return False
 
 
+def flush(token_or_pid: str, buf: list, batch_id: str) -> bool:
+    """Send one batch and log it. Returns False only when it should be retried (with the same batch_id)."""
+    ok = submit_vitals(token_or_pid, buf, batch_id)
+    latest = buf[-1]
+    parts = ", ".join(f"{k}={v}" for k, v in latest.items() if v is not None and k not in ("confidence", "simulated", "ts"))
+    if ok:
+        log.info("[OK] %d reading(s), latest: %s", len(buf), parts)
+    else:
+        log.warning("[FAIL] %d reading(s), latest: %s", len(buf), parts)
+    return ok is not False
+
+
+# -----------------------------------------------------------------------------
+# Background sender: the sampling loop only enqueues, so a slow or timed-out POST
+# never delays the next sensor read.
+# -----------------------------------------------------------------------------
+# (token_or_pid, readings) batches waiting to be sent, oldest first
+_Q: "queue.Queue[tuple[str, list]]" = queue.Queue(maxsize=256)
+# Readings per merged POST; the server rejects more than VITALS_BATCH_MAX (500) in app.py
+MAX_BATCH = max(1, min(500, int(os.getenv("CAREPILOT_MAX_BATCH", "500"))))
+# Failed batches are resent ahead of newer ones until their readings are this old (seconds)
+MAX_SAMPLE_AGE = float(os.getenv("CAREPILOT_MAX_SAMPLE_AGE", "60"))
+# Pause after a failed round doubles from 0.5s up to this, so an outage isn't hammered
+RETRY_BACKOFF_MAX_S = 30.0
+
+
+def enqueue(token_or_pid: str, readings: list) -> None:
+    """Hand a batch to the sender. When the queue is full the oldest batch is dropped."""
+    while True:
+        try:
+            _Q.put_nowait((token_or_pid, readings))
+            return
+        except queue.Full:
+            try:
+                _Q.get_nowait()
+                log.warning("Send queue full; dropped oldest readings")
+            except queue.Empty:
+                pass
+
+
+def _sample_age(vitals: dict, now: float) -> float:
+    try:
+        return now - calendar.timegm(time.strptime(vitals["ts"], "%Y-%m-%dT%H:%M:%S"))
+    except (KeyError, ValueError):
+        return 0.0
+
+
+def _drop_stale(batches: list) -> list:
+    """Keep only readings younger than MAX_SAMPLE_AGE; bounds what an outage can pile up."""
+    now = time.time()
+    kept = []
+    dropped = 0
+    for token, readings, batch_id in batches:
+        fresh = [v for v in readings if _sample_age(v, now) < MAX_SAMPLE_AGE]
+        dropped += len(readings) - len(fresh)
+        if fresh:
+            # A subset keeps the id: if the full batch was stored after all, the server skips it
+            kept.append((token, fresh, batch_id))
+    if dropped:
+        log.warning("Dropped %d reading(s) older than %gs", dropped, MAX_SAMPLE_AGE)
+    return kept
+
+
+def _send_batches(batches: list) -> list:
+    """Flush (token, readings, batch_id) batches; returns the ones to retry, stale readings removed."""
+    failed = [b for b in batches if not flush(*b)]
+    return _drop_stale(failed) if failed else []
+
+
+def _sender() -> None:
+    # Failed batches are resent unchanged (same batch id, never merged with newer readings)
+    # before anything new is sent
+    retry: list = []
+    backoff = 0.0
+    while True:
+        if not retry:
+            items = [_Q.get()]
+            queued = len(items[0][1])
+            # Asynchronous batching: after the first batch, keep collecting for up to DRAIN_S (or
+            # until MAX_BATCH readings) so a burst goes out as one request instead of several.
+            deadline = time.monotonic() + DRAIN_S
+            while queued < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = _Q.get(timeout=remaining) if remaining > 0 else _Q.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                queued += len(item[1])
+            batches = []
+            token, readings = items[0][0], list(items[0][1])
+            for next_token, next_readings in items[1:]:
+                if next_token == token and len(readings) + len(next_readings) <= MAX_BATCH:
+                    readings.extend(next_readings)
+                    continue
+                batches.append((token, readings, uuid.uuid4().hex))
+                token, readings = next_token, list(next_readings)
+            batches.append((token, readings, uuid.uuid4().hex))
+            retry = _send_batches(batches)
+        else:
+            retry = _send_batches(retry)
+        if retry:
+            backoff = min(RETRY_BACKOFF_MAX_S, max(0.5, backoff * 2))
+            time.sleep(backoff)
+        else:
+            backoff = 0.0
+
+
+def start_sender() -> None:
+    threading.Thread(target=_sender, name="vitals-sender", daemon=True).start()
+
+
+# A reading is only sent when some field moved more than this since the last one sent
+DELTAS = {"spo2": 0.5, "hr": 2, "temp_c": 0.2, "bp_sys": 3, "bp_dia": 3}
+# ...or when nothing has been sent for this long, so staff can see the sensor is still alive
+MAX_HEARTBEAT = float(os.getenv("CAREPILOT_HEARTBEAT", "60"))
+# Last reading sent for the current patient, and when (monotonic)
+_LAST_SENT = {"vitals": None, "at": 0.0}
+
+
+def should_send(vitals: dict, now: float) -> bool:
+    """True when the reading changed meaningfully, or the heartbeat is due. Records it as sent."""
+    last = _LAST_SENT["vitals"]
+    if MAX_HEARTBEAT > 0 and last is not None and now - _LAST_SENT["at"] < MAX_HEARTBEAT:
+        changed = False
+        for k, delta in DELTAS.items():
+            v, prev = vitals.get(k), last.get(k)
+            # A field appearing or dropping out (sensor attached/removed) always counts
+            if (v is None) != (prev is None) or (v is not None and abs(v - prev) > delta):
+                changed = True
+                break
+        if not changed:
+            return False
+    _LAST_SENT.update(vitals=vitals, at=now)
+    return True
+
+
 def main():
     token_or_pid = get_token_or_pid()
     if not token_or_pid:
-        print("Set CAREPILOT_TOKEN or CAREPILOT_PID (or CAREPILOT_TOKEN_FILE).", file=sys.stderr)
+        log.error("Set CAREPILOT_TOKEN or CAREPILOT_PID (or CAREPILOT_TOKEN_FILE).")
         sys.exit(1)
-    print(f"Sensor bridge → {BASE_URL}  token/pid={token_or_pid}  every {INTERVAL}s  device={DEVICE_ID}")
-    print("Press Ctrl+C to stop.")
+    watch_token_file()
+    start_sender()
+    log.info(
+        "Sensor bridge → %s  token/pid=%s  sampling %g Hz, sending every %ss (up to %d readings)  device=%s",
+        BASE_URL, token_or_pid, SAMPLE_HZ, INTERVAL, BATCH_SIZE, DEVICE_ID,
+    )
+    log.info("Press Ctrl+C to stop.")
+    buf: list = []
+    last_flush = time.monotonic()
+    period = 1.0 / SAMPLE_HZ
+    # Absolute schedule: sensor reads and token checks don't push later samples back
+    next_tick = time.monotonic()
     while True:
+        new_token = poll_token(token_or_pid)
+        if new_token != token_or_pid:
+            # Readings taken so far belong to the previous patient
+            if buf:
+                enqueue(token_or_pid, buf)
+                buf = []
+                last_flush = time.monotonic()
+            log.info("Token changed: %s → %s", token_or_pid, new_token)
+            token_or_pid = new_token
+            _LAST_SENT.update(vitals=None, at=0.0)  # first reading for a new patient always goes out
         vitals = read_vitals()
-        ok = submit_vitals(token_or_pid, vitals)
-        status = "OK" if ok else "FAIL"
-        parts = [f"{k}={v}" for k, v in vitals.items() if v is not None and k not in ("confidence", "simulated")]
-        print(f"[{status}] {', '.join(parts)}")
-        time.sleep(INTERVAL)
+        # Same UTC ISO format the server stamps itself, so batched readings keep their sample time
+        vitals["ts"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+        if should_send(vitals, time.monotonic()):
+            buf.append(vitals)
+        # Nothing buffered means nothing changed this interval: no request at all
+        if buf and (len(buf) >= BATCH_SIZE or time.monotonic() - last_flush >= INTERVAL):
+            enqueue(token_or_pid, buf)
+            buf = []
+            last_flush = time.monotonic()
+        next_tick += period
+        sleep_for = next_tick - time.monotonic()
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+        else:
+            next_tick = time.monotonic()  # fell behind (slow sensor read); resync rather than burst
 
 
 if __name__ == "__main__":
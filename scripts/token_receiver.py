@@ -15,51 +15,152 @@ Usage on the Nano:
 
 When a patient checks in at the kiosk, the page POSTs to http://localhost:9999/current-token
 and this script writes the token to TOKEN_FILE. The bridge then uses it on its next run.
+
+Serves HTTP/1.1 from a single asyncio event loop (stdlib only): kiosk connections are kept
+alive between POSTs and no thread is spawned per request.
+Bodies over 4 KB are refused; if orjson is installed it parses them (stdlib json otherwise).
+Only Content-Length bodies are supported; chunked (Transfer-Encoding) requests get a 501.
+
+Runs on Python 3.6+ (the Python that ships with JetPack 4 on the Nano), like sensor_bridge.py.
 """
 
+import asyncio
 import json
 import os
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # stdlib fallback; same bytes-in shape
+    def _loads(body: bytes):
+        return json.loads(body.decode("utf-8"))
 
 PORT = int(os.getenv("TOKEN_RECEIVER_PORT", "9999"))
 TOKEN_FILE = os.getenv("TOKEN_FILE", "/tmp/carepilot_current_token.txt")
+# Idle keep-alive connections are closed after this many seconds
+IDLE_TIMEOUT_S = 60
+# A token POST is a few dozen bytes; larger bodies are refused without being read
+MAX_BODY = 4096
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 501: "Not Implemented"}
+
+
+def write_token(token: str) -> None:
+    """
+    Replace TOKEN_FILE atomically: write a temp file beside it, then rename over it, so the
+    bridge never reads a half-written token.
+    No fsync: the file only needs to survive until the bridge reads it, not a power loss.
+    """
+    tmp = f"{TOKEN_FILE}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, (token + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+    os.replace(tmp, TOKEN_FILE)
+
 
+def handle_token(body: bytes) -> None:
+    try:
+        data = _loads(body)
+        token = (data.get("token") or "").strip()
+        if token:
+            write_token(token)
+            sys.stderr.write(f"Token written: {token}\n")
+    except Exception as e:
+        sys.stderr.write(f"Error: {e}\n")
+
+
+def _response(status: int, body: bytes, keep_alive: bool) -> bytes:
+    head = (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def _log(request_line: str, status: int) -> None:
+    sys.stderr.write(f'{time.strftime("%d/%b/%Y %H:%M:%S")} - "{request_line}" {status} -\n')
 
-class TokenHandler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        if self.path != "/current-token" and self.path != "/current-token/":
-            self.send_response(404)
-            self.end_headers()
-            return
-        content_length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_length) if content_length else b""
-        try:
-            data = json.loads(body.decode("utf-8"))
-            token = (data.get("token") or "").strip()
-            if token:
-                with open(TOKEN_FILE, "w") as f:
-                    f.write(token + "\n")
-                sys.stderr.write(f"Token written: {token}\n")
-        except Exception as e:
-            sys.stderr.write(f"Error: {e}\n")
-        self.send_response(200)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(b'{"ok":true}')
-
-    def log_message(self, format, *args):
-        sys.stderr.write("%s - %s\n" % (self.log_date_time_string(), format % args))
+
+async def _reject(writer: asyncio.StreamWriter, request_line: str, status: int) -> None:
+    """Answer a request that can't be served and close the connection (its body is not read)."""
+    _log(request_line, status)
+    writer.write(_response(status, b'{"ok":false}', keep_alive=False))
+    await writer.drain()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve requests on one connection until the client closes it, asks to, or goes idle."""
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT_S)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                return
+            request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+            headers = {}
+            for line in header_lines:
+                name, sep, value = line.partition(":")
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+            parts = request_line.split()
+            try:
+                content_length = int(headers.get("content-length", "0"))
+            except ValueError:
+                content_length = -1
+            if len(parts) != 3 or content_length < 0:
+                await _reject(writer, request_line, 400)
+                return
+            if "transfer-encoding" in headers:
+                # Chunked bodies aren't parsed; reading on would treat the chunks as the next request
+                await _reject(writer, request_line, 501)
+                return
+            if content_length > MAX_BODY:
+                await _reject(writer, request_line, 413)
+                return
+            method, path, version = parts
+            # Always consume the body so the next request on this connection starts cleanly
+            body = await reader.readexactly(content_length) if content_length else b""
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+            if method != "POST":
+                status, payload = 501, b'{"ok":false}'
+            elif path not in ("/current-token", "/current-token/"):
+                status, payload = 404, b'{"ok":false}'
+            else:
+                handle_token(body)
+                status, payload = 200, b'{"ok":true}'
+            _log(request_line, status)
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return
+    finally:
+        writer.close()
 
 
 def main():
-    server = HTTPServer(("0.0.0.0", PORT), TokenHandler)
+    # Explicit loop handling instead of asyncio.run / serve_forever, which need Python 3.7
+    loop = asyncio.get_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(handle_connection, "0.0.0.0", PORT))
     print(f"Token receiver listening on port {PORT}. Writing to {TOKEN_FILE}")
     print("When kiosk checks in a patient, token is saved so sensor_bridge can send vitals.")
     try:
-        server.serve_forever()
+        loop.run_forever()
     except KeyboardInterrupt:
-        server.shutdown()
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
 
 
 if __name__ == "__main__":